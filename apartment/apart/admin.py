@@ -1,10 +1,17 @@
-from django.contrib import admin
-from django.db.models import Count, Max
+import json
+import os
+
+from django.contrib import admin, messages
+from django.http import JsonResponse
 from django.shortcuts import render
 from django.template.response import TemplateResponse
 from django.utils.html import mark_safe
+from .analytics import maximum_ratings, survey_statistics
+from .billing import BillingConflict, parse_charges, run_billing
+from .dbpool.pool import connection_stats
+from .replicas import use_replica
 from .models import Resident, Flat, Bill, Item, Feedback, Survey, SurveyResult, FaMember, Product, Cart, CartProduct, \
-    Order, OrderProduct
+    Order, OrderProduct, MeterReading, PendingUpload, MediaAsset, UserSession
 from django import forms
 from django.urls import path, reverse
 
@@ -16,23 +23,25 @@ class MyApartAdminSite(admin.AdminSite):
         urls = super().get_urls()
         custom_urls = [
             path('statistics/', self.admin_view(self.stats_view), name='statistics'),
+            path('db-connections/', self.admin_view(self.db_connections_view), name='db-connections'),
         ]
         return custom_urls + urls
 
+    @use_replica
     def stats_view(self, request):
         try:
             # Query for statistics here
-            queryset = SurveyResult.objects.all()
-            stats = queryset.aggregate(
-                maximum_cleanliness=Max('cleanliness_rating'),
-                maximum_facilities=Max('facilities_rating'),
-                maximum_services=Max('services_rating')
-            )
+            summary = survey_statistics()
+            stats = {**maximum_ratings(summary), **summary}
             # Render the template with statistics
-            return render(request, 'admin/statistical.html', {'stats': stats})
+            return render(request, 'admin/statistical.html', {'stats': stats, 'stats_json': json.dumps(stats)})
         except Exception as e:
             return render(request, 'admin/statistical.html', {"message": str(e)})
 
+    def db_connections_view(self, request):
+        # Counters are per worker process; poll each worker (or aggregate in logs) to size the pool.
+        return JsonResponse({'pid': os.getpid(), 'databases': connection_stats()})
+
     def index(self, request, extra_context=None):
         extra_context = extra_context or {}
         extra_context['stats_link'] = reverse('admin:statistics', current_app=admin_site.name)
@@ -42,9 +51,57 @@ class MyApartAdminSite(admin.AdminSite):
 admin_site = MyApartAdminSite(name='myAdmin')
 
 
+class BillingRunForm(forms.Form):
+    period = forms.RegexField(regex=r'^\d{4}-(0[1-9]|1[0-2])$', label='Kỳ thanh toán (YYYY-MM)')
+    charges = forms.CharField(widget=forms.Textarea(attrs={'rows': 4}), label='Khoản phí',
+                              help_text='Mỗi dòng một khoản: <loại hóa đơn>=<số tiền>')
+    issue_date = forms.DateField(required=False, label='Ngày phát hành')
+    due_date = forms.DateField(required=False, label='Hạn thanh toán')
+
+    def clean_charges(self):
+        try:
+            charges = parse_charges(self.cleaned_data['charges'].splitlines())
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+        if not charges:
+            raise forms.ValidationError('Cần ít nhất một khoản phí.')
+        return charges
+
+
+class ResidentAdmin(admin.ModelAdmin):
+    list_display = ['username', 'first_name', 'last_name', 'phone', 'is_active']
+    search_fields = ['username', 'first_name', 'last_name', 'phone']
+    actions = ['create_monthly_bills']
+
+    @admin.action(description='Tạo hóa đơn tháng cho cư dân đã chọn')
+    def create_monthly_bills(self, request, queryset):
+        form = BillingRunForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            data = form.cleaned_data
+            try:
+                result = run_billing(data['period'], data['charges'], issue_date=data['issue_date'],
+                                     due_date=data['due_date'], residents=queryset)
+            except BillingConflict as e:
+                self.message_user(request, str(e), level=messages.ERROR)
+                return None
+            self.message_user(request, f"Kỳ {result['period']}: đã tạo {result['created']} hóa đơn, "
+                                       f"bỏ qua {result['skipped']} hóa đơn đã có cho {result['residents']} cư dân.")
+            return None
+        return TemplateResponse(request, 'admin/billing_run.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Tạo hóa đơn tháng',
+            'form': form,
+            'queryset': queryset,
+            'action_checkbox_name': admin.helpers.ACTION_CHECKBOX_NAME,
+        })
+
 
 admin_site.register(Flat)
-admin_site.register(Resident)
+admin_site.register(MeterReading)
+admin_site.register(PendingUpload)
+admin_site.register(MediaAsset)
+admin_site.register(UserSession)
+admin_site.register(Resident, ResidentAdmin)
 admin_site.register(Product)
 admin_site.register(Cart)
 admin_site.register(CartProduct)
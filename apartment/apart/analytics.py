@@ -0,0 +1,84 @@
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import SurveyResult
+
+RATING_FIELDS = ('cleanliness_rating', 'facilities_rating', 'services_rating')
+RATING_NAMES = ('cleanliness', 'facilities', 'services')
+PERCENTILES = (10, 25, 50, 75, 90)
+RATING_SCALE = (1, 5)
+
+SURVEY_STATS_TIMEOUT = getattr(settings, 'SURVEY_STATS_TIMEOUT', 3600)
+SURVEY_STATS_CHUNK_SIZE = getattr(settings, 'SURVEY_STATS_CHUNK_SIZE', 5000)
+
+
+def _stats_key(survey_id):
+    return f'survey-stats:{survey_id if survey_id is not None else "all"}'
+
+
+def load_ratings(queryset):
+    rows = queryset.values_list(*RATING_FIELDS).iterator(chunk_size=SURVEY_STATS_CHUNK_SIZE)
+    return np.fromiter(chain.from_iterable(rows), dtype=np.int32).reshape(-1, len(RATING_FIELDS))
+
+
+def rating_histograms(ratings):
+    low, high = RATING_SCALE
+    width = high - low + 3
+    # Shift each column into its own bin range, so one bincount builds every histogram.
+    # Out-of-scale values land in the two edge bins, which are dropped.
+    bins = np.clip(ratings - low + 1, 0, width - 1) + width * np.arange(ratings.shape[1])
+    counts = np.bincount(bins.ravel(), minlength=width * ratings.shape[1]).reshape(ratings.shape[1], width)
+    return counts[:, 1:-1]
+
+
+def summarize_ratings(ratings):
+    summary = {'count': int(ratings.shape[0])}
+    if not ratings.shape[0]:
+        for name in RATING_NAMES:
+            summary[name] = None
+        return summary
+
+    values = ratings.astype(np.float64)
+    means = values.mean(axis=0)
+    medians = np.median(values, axis=0)
+    stds = values.std(axis=0)
+    minimums = ratings.min(axis=0)
+    maximums = ratings.max(axis=0)
+    percentiles = np.percentile(values, PERCENTILES, axis=0)
+    histograms = rating_histograms(ratings)
+
+    low, high = RATING_SCALE
+    for i, name in enumerate(RATING_NAMES):
+        summary[name] = {
+            'mean': round(float(means[i]), 3),
+            'median': float(medians[i]),
+            'std': round(float(stds[i]), 3),
+            'min': int(minimums[i]),
+            'max': int(maximums[i]),
+            'percentiles': {f'p{p}': float(percentiles[j, i]) for j, p in enumerate(PERCENTILES)},
+            'histogram': {str(score): int(histograms[i, score - low]) for score in range(low, high + 1)},
+        }
+    return summary
+
+
+def survey_statistics(survey_id=None):
+    key = _stats_key(survey_id)
+    summary = cache.get(key)
+    if summary is None:
+        queryset = SurveyResult.objects.all()
+        if survey_id is not None:
+            queryset = queryset.filter(survey_id=survey_id)
+        summary = summarize_ratings(load_ratings(queryset))
+        cache.set(key, summary, SURVEY_STATS_TIMEOUT)
+    return summary
+
+
+def maximum_ratings(summary):
+    return {f'maximum_{name}': summary[name]['max'] if summary[name] else None for name in RATING_NAMES}
+
+
+def invalidate_survey_statistics(survey_id):
+    cache.delete_many([_stats_key(survey_id), _stats_key(None)])
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ApartConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apart'
+
+    def ready(self):
+        from . import caches, signals  # noqa: F401
@@ -0,0 +1,209 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+
+from .caches import is_shared
+
+AUTH_CACHE_SIZE = getattr(settings, 'AUTH_CACHE_SIZE', 10000)
+AUTH_CACHE_TIMEOUT = getattr(settings, 'AUTH_CACHE_TIMEOUT', 300)
+AUTH_CACHE_ALIAS = getattr(settings, 'AUTH_CACHE_ALIAS', 'default')
+
+GENERATION_KEY = 'auth:generation'
+
+
+class SnapshotCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.generation = None
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, value, expires_at, user_id):
+        with self._lock:
+            self._entries[key] = (expires_at, user_id, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self.invalidations += 1
+            self._entries.pop(key, None)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            self.invalidations += 1
+            for key in [key for key, entry in self._entries.items() if entry[1] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local = SnapshotCache(AUTH_CACHE_SIZE)
+
+
+def _shared():
+    # The generation counter and user index must be seen by every worker; a per-process cache would let a
+    # locked account keep authenticating from other workers' LRUs, so caching is off without a shared one.
+    return caches[AUTH_CACHE_ALIAS] if is_shared(AUTH_CACHE_ALIAS) else None
+
+
+def _key(kind, credential):
+    return f'auth:{kind}:{hashlib.sha256(credential.encode()).hexdigest()}'
+
+
+def _user_index_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def _sync_generation(shared):
+    # One cache read per request lets an invalidation in any worker empty every worker's local LRU.
+    generation = shared.get(GENERATION_KEY)
+    if generation != _local.generation:
+        _local.clear()
+        _local.generation = generation
+
+
+def _snapshot(instance):
+    fields = [field.attname for field in instance._meta.concrete_fields]
+    return instance._meta.label, fields, [getattr(instance, name) for name in fields]
+
+
+def _restore(snapshot):
+    label, fields, values = snapshot
+    return apps.get_model(label).from_db('default', fields, values)
+
+
+def _epoch():
+    shared = _shared()
+    if shared is not None:
+        _sync_generation(shared)
+    return _local.invalidations, _local.generation
+
+
+def cached_credentials(kind, credential):
+    key = _key(kind, credential)
+    _epoch()
+    shared = _shared()
+    entry = _local.get(key)
+    if entry is None and shared is not None:
+        entry = shared.get(key)
+        if entry is not None:
+            _local.set(key, entry, entry['expires_at'], entry['user_id'])
+    if entry is None or entry['expires_at'] <= time.time():
+        return None
+    user, auth = _restore(entry['user']), _restore(entry['auth'])
+    if getattr(auth, 'user_id', None) == user.pk:
+        auth.user = user
+    return user, auth
+
+
+def remember_credentials(kind, credential, user, auth, expires=None):
+    expires_at = time.time() + AUTH_CACHE_TIMEOUT
+    if expires is not None:
+        expires_at = min(expires_at, expires.timestamp())
+    if expires_at <= time.time():
+        return
+    key = _key(kind, credential)
+    entry = {'expires_at': expires_at, 'user_id': user.pk, 'user': _snapshot(user), 'auth': _snapshot(auth)}
+    _local.set(key, entry, expires_at, user.pk)
+    shared = _shared()
+    if shared is not None:
+        timeout = max(1, int(expires_at - time.time()))
+        index_key = _user_index_key(user.pk)
+        shared.set(key, entry, timeout)
+        shared.set(index_key, list({*(shared.get(index_key) or []), key}), AUTH_CACHE_TIMEOUT)
+
+
+def invalidate_user(user_id):
+    _local.discard_user(user_id)
+    shared = _shared()
+    if shared is None:
+        return
+    index_key = _user_index_key(user_id)
+    shared.delete_many([*(shared.get(index_key) or []), index_key])
+    _bump_generation(shared)
+
+
+def invalidate_credential(kind, credential):
+    key = _key(kind, credential)
+    _local.discard(key)
+    shared = _shared()
+    if shared is not None:
+        shared.delete(key)
+        # Other workers may still hold the credential in their local LRU; the new generation empties it.
+        _bump_generation(shared)
+
+
+def _bump_generation(shared):
+    try:
+        shared.incr(GENERATION_KEY)
+    except ValueError:
+        shared.set(GENERATION_KEY, 1, None)
+
+
+def _credential(request, keyword):
+    auth = get_authorization_header(request).split()
+    if len(auth) != 2 or auth[0].lower() != keyword.lower().encode():
+        return None
+    try:
+        return auth[1].decode()
+    except UnicodeError:
+        return None
+
+
+def authenticate_cached(kind, credential, authenticate):
+    if _shared() is None:
+        return authenticate()
+    cached = cached_credentials(kind, credential)
+    if cached is not None:
+        return cached
+    epoch = _epoch()
+    result = authenticate()
+    # Skip the write if the user was invalidated while we were reading it, or a stale row gets cached.
+    if result is not None and _epoch() == epoch:
+        user, auth = result
+        remember_credentials(kind, credential, user, auth, getattr(auth, 'expires', None))
+    return result
+
+
+class CachedOAuth2Authentication(OAuth2Authentication):
+    def authenticate(self, request):
+        credential = _credential(request, 'Bearer')
+        if credential is None:
+            return super().authenticate(request)
+        result = authenticate_cached('oauth2', credential, partial(super().authenticate, request))
+        if result is not None and not result[0].is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return result
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        user, token = authenticate_cached('token', key, partial(super().authenticate_credentials, key))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return user, token
@@ -0,0 +1,127 @@
+import calendar
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import DecimalValidator
+from django.db import IntegrityError, transaction
+
+from .dashboard import invalidate_dashboard
+from .models import Bill, Resident
+from .rollups import lock_global_rollup, record_bills_created
+
+BILLING_CHUNK_SIZE = getattr(settings, 'BILLING_CHUNK_SIZE', 2000)
+BILLING_ATTEMPTS = 3
+
+
+class BillingConflict(Exception):
+    pass
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f'"{value}" is not a valid amount.')
+    if not amount.is_finite() or amount < 0:
+        raise ValueError(f'Amount "{value}" must be a non-negative number.')
+    field = Bill._meta.get_field('amount')
+    try:
+        DecimalValidator(field.max_digits, field.decimal_places)(amount)
+    except ValidationError as e:
+        raise ValueError(f'Amount "{value}": {" ".join(e.messages)}')
+    return amount
+
+
+def parse_period(value):
+    return datetime.strptime(value, '%Y-%m').strftime('%Y-%m')
+
+
+def period_bounds(period):
+    year, month = map(int, period.split('-'))
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def parse_charges(lines):
+    charges = {}
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        bill_type, sep, amount = line.rpartition('=')
+        if not sep or not bill_type.strip():
+            raise ValueError(f'Charge "{line}" must look like "<bill type>=<amount>".')
+        charges[bill_type.strip()] = parse_amount(amount.strip())
+    return charges
+
+
+def _insert_period_bills(period, bills):
+    with transaction.atomic():
+        # Before the first read, so the per-resident rollups recomputed below see every committed bill.
+        lock_global_rollup()
+        existing = set(Bill.objects.filter(
+            period=period,
+            resident_id__in={bill.resident_id for bill in bills},
+            bill_type__in={bill.bill_type for bill in bills},
+        ).values_list('resident_id', 'bill_type'))
+        new_bills = [bill for bill in bills if (bill.resident_id, bill.bill_type) not in existing]
+        Bill.objects.bulk_create(new_bills, batch_size=BILLING_CHUNK_SIZE)
+        record_bills_created(new_bills)
+    return len(new_bills)
+
+
+def create_period_bills(period, bills):
+    # Idempotent per (resident, period, bill_type): rows that already exist are skipped.
+    for _ in range(BILLING_ATTEMPTS):
+        try:
+            return _insert_period_bills(period, bills)
+        except IntegrityError:
+            # A concurrent run inserted some of these rows after we read; its rows are visible once it commits,
+            # so the next attempt skips them like any other existing bill.
+            for bill in bills:
+                bill.pk = None
+                bill._state.adding = True
+    raise BillingConflict(f'Another billing run for {period} keeps creating the same bills; try again later.')
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_billing(period, charges, issue_date=None, due_date=None, residents=None, chunk_size=BILLING_CHUNK_SIZE,
+                progress=None):
+    period = parse_period(period)
+    first_day, last_day = period_bounds(period)
+    issue_date = issue_date or first_day
+    due_date = due_date or last_day
+
+    if residents is None:
+        residents = Resident.objects.all()
+    resident_ids = residents.filter(is_active=True, is_superuser=False).order_by('id').values_list('id', flat=True)
+    total = resident_ids.count()
+
+    result = {'period': period, 'residents': 0, 'created': 0, 'skipped': 0}
+    for chunk in _chunks(resident_ids.iterator(chunk_size=chunk_size), chunk_size):
+        bills = [
+            Bill(resident_id=resident_id, bill_type=bill_type, amount=amount, issue_date=issue_date,
+                 due_date=due_date, period=period)
+            for resident_id in chunk
+            for bill_type, amount in charges.items()
+        ]
+        created = create_period_bills(period, bills)
+        result['residents'] += len(chunk)
+        result['created'] += created
+        result['skipped'] += len(bills) - created
+        if progress:
+            progress(result['residents'], total, result['created'])
+
+    invalidate_dashboard()
+    return result
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Warning, register
+
+# Backends whose entries never leave the current process.
+LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared(alias='default'):
+    return alias is not None and alias in settings.CACHES and not isinstance(caches[alias], LOCAL_BACKENDS)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    if is_shared():
+        return []
+    # Cart totals, catalog pages, the dashboard, survey stats and replica pins are invalidated through the
+    # default cache; a per-process cache only drops the entry in the worker that handled the write.
+    return [Warning(
+        'The default cache is local to each process, so cache invalidations do not reach other workers.',
+        hint="Point CACHES['default'] at Redis or Memcached when running more than one worker.",
+        id='apart.W001',
+    )]
@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Prefetch, Sum, prefetch_related_objects
+
+from .models import CartProduct
+
+CART_TOTALS_TIMEOUT = getattr(settings, 'CART_TOTALS_TIMEOUT', 300)
+
+
+def _totals_key(cart_id):
+    return f'cart:{cart_id}:totals'
+
+
+def cart_totals(cart_id):
+    key = _totals_key(cart_id)
+    totals = cache.get(key)
+    if totals is None:
+        totals = CartProduct.objects.filter(cart_id=cart_id).aggregate(
+            line_count=Count('id'),
+            total_price=Sum(F('quantity') * F('product__price')),
+        )
+        totals['total_price'] = totals['total_price'] or 0
+        cache.set(key, totals, CART_TOTALS_TIMEOUT)
+    return totals
+
+
+def invalidate_cart_totals(*cart_ids):
+    cache.delete_many([_totals_key(cart_id) for cart_id in cart_ids])
+
+
+def schedule_cart_totals_invalidation(*cart_ids):
+    # After commit, so a concurrent read cannot re-cache totals from rows that are about to change.
+    transaction.on_commit(lambda: invalidate_cart_totals(*cart_ids))
+
+
+def prefetch_cart_lines(cart):
+    prefetch_related_objects(
+        [cart], Prefetch('cartproduct_set', queryset=CartProduct.objects.select_related('product')))
+    return cart
+
+
+def add_to_cart(cart, product, quantity):
+    lines = CartProduct.objects.filter(cart=cart, product=product)
+    if not lines.update(quantity=F('quantity') + quantity):
+        try:
+            with transaction.atomic():
+                CartProduct.objects.create(cart=cart, product=product, quantity=quantity)
+        except IntegrityError:
+            # Another request inserted the line first; fall back to the increment.
+            lines.update(quantity=F('quantity') + quantity)
+    schedule_cart_totals_invalidation(cart.id)
+    return lines.select_related('product').get()
+
+
+def set_cart_quantity(cart, product_id, quantity):
+    lines = CartProduct.objects.filter(cart=cart, product_id=product_id)
+    if quantity <= 0:
+        changed = lines.delete()[0]
+    else:
+        changed = lines.update(quantity=quantity)
+    schedule_cart_totals_invalidation(cart.id)
+    return bool(changed)
@@ -0,0 +1,44 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600)
+VERSION_KEY = 'catalog:version'
+
+
+def catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted counter never reuses an old version.
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time() * 1000), None)
+
+
+def schedule_catalog_bump():
+    transaction.on_commit(bump_catalog_version)
+
+
+def catalog_page_key(request):
+    query = '&'.join(f'{k}={v}' for k, v in sorted(request.query_params.items()))
+    # Image and next/previous links in the payload are absolute, so each scheme and host gets its own entry.
+    return f'catalog:{catalog_version()}:{request.scheme}://{request.get_host()}{request.path}?{query}'
+
+
+def render_catalog_page(key, data):
+    content = JSONRenderer().render(data)
+    etag = '"%s"' % hashlib.sha1(content).hexdigest()
+    page = (etag, content)
+    cache.set(key, page, CATALOG_CACHE_TIMEOUT)
+    return page
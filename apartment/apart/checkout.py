@@ -0,0 +1,66 @@
+from django.db import transaction
+
+from .catalog import schedule_catalog_bump
+from .models import CartProduct, Order, OrderProduct, Product
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCart(CheckoutError):
+    pass
+
+
+class OutOfStock(CheckoutError):
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__('Not enough stock for: ' + ', '.join(s['name'] for s in shortages))
+
+
+class CartChanged(CheckoutError):
+    pass
+
+
+def checkout_cart(resident):
+    with transaction.atomic():
+        # Locked so a double submit waits here and then finds the cart already emptied by the first checkout.
+        lines = list(CartProduct.objects.select_for_update().filter(cart__resident=resident)
+                     .order_by('id').values_list('id', 'product_id', 'quantity'))
+        if not lines:
+            raise EmptyCart('Cart is empty')
+
+        # Lock rows in primary key order so concurrent checkouts cannot deadlock.
+        product_ids = sorted({product_id for _, product_id, _ in lines})
+        products = Product.objects.select_for_update().filter(id__in=product_ids).order_by('id').in_bulk()
+
+        wanted = {}
+        for _, product_id, quantity in lines:
+            wanted[product_id] = wanted.get(product_id, 0) + quantity
+
+        shortages = [
+            {'product_id': product_id, 'name': products[product_id].name,
+             'requested': quantity, 'available': products[product_id].stock}
+            for product_id, quantity in wanted.items()
+            if products[product_id].stock < quantity
+        ]
+        if shortages:
+            raise OutOfStock(shortages)
+
+        total_amount = sum(products[product_id].price * quantity for product_id, quantity in wanted.items())
+        order = Order.objects.create(resident=resident, total_amount=total_amount)
+        OrderProduct.objects.bulk_create([
+            OrderProduct(order=order, product_id=product_id, quantity=quantity, price=products[product_id].price)
+            for product_id, quantity in wanted.items()
+        ])
+
+        for product_id, quantity in wanted.items():
+            products[product_id].stock -= quantity
+        Product.objects.bulk_update(list(products.values()), ['stock'])
+        schedule_catalog_bump()
+
+        deleted, _ = CartProduct.objects.filter(id__in=[line_id for line_id, _, _ in lines]).delete()
+        if deleted < len(lines):
+            # Another request removed a line we charged for; undo the order and the stock change.
+            raise CartChanged('Cart changed during checkout, try again')
+    return order
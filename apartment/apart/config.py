@@ -3,4 +3,14 @@ config = {
       "key1": "PcY4iZIKFCIdgZvA6ueMcMHHUbRLYjPL",
       "key2": "kLtgPl8HHhfvMuDHPwKfgfsY4Ydm9eIz",
       "endpoint": "https://sb-openapi.zalopay.vn/v2/create"
-}
\ No newline at end of file
+}
+
+momo_config = {
+      "partner_code": "MOMO",
+      "access_key": "F8BBA842ECF85",
+      "secret_key": "K951B6PE1waDMi640xX08PD3vg6EkVlz",
+      "redirect_url": "https://momo.vn/return",
+      "ipn_url": "https://callback.url/notify",
+      "request_type": "payWithATM",
+      "endpoint": "https://test-payment.momo.vn/v2/gateway/api/create"
+}
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .models import Flat, Resident, SurveyResult
+from .rollups import get_bill_rollup
+
+DASHBOARD_CACHE_TIMEOUT = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 30)
+VERSION_KEY = 'dashboard:version'
+
+
+def invalidate_dashboard():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def _dashboard_key(user):
+    role = 'superuser' if user.is_superuser else f'resident:{user.id}'
+    return f'dashboard:{cache.get_or_set(VERSION_KEY, 1, None)}:{role}'
+
+
+def compute_dashboard(user):
+    residents = Resident.objects.aggregate(
+        staff_count=Count('id', filter=Q(is_superuser=False)),
+        admin_count=Count('id', filter=Q(is_superuser=True)),
+        is_staff_count=Count('id', filter=Q(is_staff=True)),
+    )
+
+    bills = get_bill_rollup(None if user.is_superuser else user)
+
+    surveys = SurveyResult.objects.all() if user.is_superuser else SurveyResult.objects.filter(resident=user)
+
+    return {
+        'resident_statistics': {
+            'staff_count': residents['staff_count'],
+            'admin_count': residents['admin_count'],
+        },
+        'staff_count': residents['is_staff_count'],
+        'flat_count': Flat.objects.count(),
+        'total_bills': bills.total_count,
+        'bill_statistics': {
+            'paid_bills': bills.paid_count,
+            'unpaid_bills': bills.unpaid_count,
+        },
+        'survey_count': surveys.count(),
+    }
+
+
+def get_dashboard(user):
+    key = _dashboard_key(user)
+    data = cache.get(key)
+    if data is None:
+        data = compute_dashboard(user)
+        cache.set(key, data, DASHBOARD_CACHE_TIMEOUT)
+    return data
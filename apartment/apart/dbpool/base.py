@@ -0,0 +1,12 @@
+from django.db.backends.mysql import base as mysql
+
+from .pool import PooledConnectionMixin
+
+
+class DatabaseWrapper(PooledConnectionMixin, mysql.DatabaseWrapper):
+    def validate_pooled(self, raw):
+        try:
+            raw.ping()
+            return True
+        except mysql.Database.Error:
+            return False
@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from functools import partial
+
+from django.db.utils import OperationalError
+
+logger = logging.getLogger(__name__)
+
+POOL_DEFAULTS = {'MAX_SIZE': 10, 'MAX_OVERFLOW': 10, 'TIMEOUT': 30, 'RECYCLE': 3600}
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+def _close_quietly(raw):
+    try:
+        raw.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    def __init__(self, max_size=10, max_overflow=10, timeout=30, recycle=3600):
+        self.max_size = max_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.stats = Counter()
+        self._idle = []
+        # id(raw) -> (raw, opened at). The entry holds the connection itself, so its id cannot be handed to another
+        # object while the pool still tracks it.
+        self._opened = {}
+        self._size = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size + self.max_overflow:
+                    self._size += 1
+                    return None
+                if not waited:
+                    waited = True
+                    self.stats['waits'] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection free after {self.timeout}s '
+                                      f'({self.max_size} + {self.max_overflow} overflow in use)')
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+    def _discard(self, raw):
+        with self._cond:
+            self._opened.pop(id(raw), None)
+            self._size -= 1
+            self.stats['closes'] += 1
+            self._cond.notify()
+        _close_quietly(raw)
+
+    def acquire(self, connect, validate=None):
+        while True:
+            raw = self._checkout()
+            if raw is None:
+                try:
+                    raw = connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self.stats['failures'] += 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._opened[id(raw)] = (raw, time.monotonic())
+                    self.stats['opens'] += 1
+                return raw
+            if validate is None or validate(raw):
+                with self._cond:
+                    self.stats['reuses'] += 1
+                return raw
+            # The server dropped it while idle (wait_timeout, failover); open a fresh one instead.
+            logger.info('Discarding a pooled database connection that failed its health check')
+            with self._cond:
+                self.stats['failures'] += 1
+            self._discard(raw)
+
+    def release(self, raw, reusable=True):
+        with self._cond:
+            tracked, opened_at = self._opened.get(id(raw), (None, 0))
+            expired = tracked is not raw or \
+                (self.recycle is not None and time.monotonic() - opened_at >= self.recycle)
+            if reusable and not expired and (self._size <= self.max_size or self._waiting):
+                self._idle.append(raw)
+                self._cond.notify()
+                return
+        # Overflow connections are closed once nobody is waiting for them.
+        self._discard(raw)
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                **{name: self.stats[name] for name in ('opens', 'reuses', 'waits', 'timeouts', 'failures', 'closes')},
+                'size': self._size, 'idle': len(self._idle), 'in_use': self._size - len(self._idle),
+                'max_size': self.max_size, 'max_overflow': self.max_overflow,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, options=None):
+    with _pools_lock:
+        if alias not in _pools:
+            options = {**POOL_DEFAULTS, **(options or {})}
+            _pools[alias] = ConnectionPool(max_size=options['MAX_SIZE'], max_overflow=options['MAX_OVERFLOW'],
+                                           timeout=options['TIMEOUT'], recycle=options['RECYCLE'])
+        return _pools[alias]
+
+
+class PooledConnectionMixin:
+    # Mixed into a backend's DatabaseWrapper: Django's connect() and close() borrow from and return to the pool.
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self.alias, self.settings_dict.get('POOL'))
+        validate = self.validate_pooled if self.settings_dict['CONN_HEALTH_CHECKS'] else None
+        return pool.acquire(partial(super().get_new_connection, conn_params), validate)
+
+    def validate_pooled(self, raw):
+        try:
+            cursor = raw.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _close(self):
+        if self.connection is None:
+            return
+        raw = self.connection
+        # Closed inside atomic(): Django keeps self.connection until the block exits, so it must not be lent out.
+        reusable = not self.in_atomic_block
+        try:
+            # Never hand the next borrower a half-finished transaction.
+            raw.rollback()
+        except Exception:
+            reusable = False
+        if self.errors_occurred and not self.validate_pooled(raw):
+            reusable = False
+        get_pool(self.alias).release(raw, reusable)
+
+
+# Connections of backends without the pool: opens come from connection_created, reuses from request_started.
+_persistent_stats = defaultdict(Counter)
+
+
+def record_connection_opened(connection):
+    if not isinstance(connection, PooledConnectionMixin):
+        _persistent_stats[connection.alias]['opens'] += 1
+
+
+def record_connections_reused(connections):
+    for connection in connections.all(initialized_only=True):
+        if connection.connection is not None and not isinstance(connection, PooledConnectionMixin):
+            _persistent_stats[connection.alias]['reuses'] += 1
+
+
+def connection_stats():
+    stats = {alias: {'pooled': False, **counters} for alias, counters in _persistent_stats.items()}
+    with _pools_lock:
+        pools = dict(_pools)
+    for alias, pool in pools.items():
+        stats[alias] = {'pooled': True, **pool.snapshot()}
+    return stats
@@ -0,0 +1,79 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.response import Response
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+RESIDENT_COLUMNS = {
+    'first_name': F('resident__first_name'),
+    'last_name': F('resident__last_name'),
+    'phone': F('resident__phone'),
+}
+BILL_COLUMNS = ['id', 'resident_id', *RESIDENT_COLUMNS, 'bill_type', 'amount', 'issue_date', 'due_date',
+                'payment_status']
+ORDER_COLUMNS = ['id', 'resident_id', *RESIDENT_COLUMNS, 'total_amount', 'order_date', 'status']
+SURVEY_RESULT_COLUMNS = ['id', 'survey_id', 'resident_id', *RESIDENT_COLUMNS, 'cleanliness_rating',
+                         'facilities_rating', 'services_rating', 'submitted_at']
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows, columns):
+    writer = csv.writer(_Echo())
+    # The BOM lets Excel open the UTF-8 (Vietnamese) text correctly.
+    yield '\ufeff' + writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([row[column] for column in columns])
+
+
+def _ndjson_lines(rows, columns):
+    for row in rows:
+        yield json.dumps({column: row[column] for column in columns}, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def keyset_rows(queryset, chunk_size=None):
+    # Pages of id > last id rather than one server-side cursor: mysqlclient buffers a cursor's whole
+    # result set client-side, and each page is an index range scan that holds no locks between pages.
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    queryset = queryset.order_by('id')
+    last_id = None
+    while True:
+        page = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        rows = list(page[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1]['id']
+
+
+def stream_export(queryset, columns, export_format, filename):
+    expressions = {name: RESIDENT_COLUMNS[name] for name in columns if name in RESIDENT_COLUMNS}
+    fields = [name for name in columns if name not in RESIDENT_COLUMNS]
+    if 'id' not in fields:
+        fields.append('id')
+    rows = keyset_rows(queryset.values(*fields, **expressions))
+
+    if export_format == 'ndjson':
+        response = StreamingHttpResponse(_ndjson_lines(rows, columns), content_type='application/x-ndjson; charset=utf-8')
+    else:
+        response = StreamingHttpResponse(_csv_lines(rows, columns), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
+
+
+def export_queryset(request, queryset, columns, filename):
+    export_format = request.query_params.get('type', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return Response({'error': f"type must be one of {', '.join(EXPORT_FORMATS)}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return stream_export(queryset, columns, export_format, filename)
@@ -0,0 +1,452 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import aiohttp
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from requests.adapters import HTTPAdapter
+
+from .config import config as zalopay_config, momo_config
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_GATEWAY = {
+    'connect_timeout': 3.05,
+    'read_timeout': 10,
+    'deadline': 15,
+    'retries': 2,
+    'backoff': 0.25,
+    'backoff_max': 2,
+    'pool_size': 10,
+    'async_pool_size': 100,
+    'failure_threshold': 5,
+    'reset_timeout': 30,
+    'endpoints': {},
+    'callback_urls': {},
+    **getattr(settings, 'PAYMENT_GATEWAY', {}),
+}
+
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+class GatewayError(Exception):
+    pass
+
+
+class GatewayUnavailable(GatewayError):
+    pass
+
+
+class InvalidCallback(GatewayError):
+    pass
+
+
+class GatewayResponseError(GatewayError):
+    def __init__(self, message, status_code=None, payload=None):
+        self.status_code = status_code
+        self.payload = payload
+        super().__init__(message)
+
+
+def sign(key, message):
+    return hmac.new(key.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+
+def verify(key, message, signature):
+    return hmac.compare_digest(sign(key, message), str(signature or ''))
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                # Let a single trial call through; everyone else keeps failing fast.
+                self._probing = True
+                return self.HALF_OPEN
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+
+    def release_probe(self):
+        # A trial call that ended without a verdict (an unexpected error) must not leave the circuit stuck half-open.
+        with self._lock:
+            self._probing = False
+
+
+class PaymentProvider(ABC):
+    name = None
+    description = None
+    config = None
+
+    def __init__(self, endpoint=None, callback_url=None):
+        self.endpoint = endpoint or self.config['endpoint']
+        self.callback_url = callback_url
+
+    @abstractmethod
+    def new_order_id(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def build_request(self, order_id, amount, description, metadata=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def parse_response(self, status_code, payload):
+        raise NotImplementedError
+
+    @abstractmethod
+    def parse_callback(self, payload):
+        raise NotImplementedError
+
+    @abstractmethod
+    def callback_response(self, error=None):
+        raise NotImplementedError
+
+
+class MomoProvider(PaymentProvider):
+    name = 'momo'
+    description = 'pay with MoMo'
+    config = momo_config
+    CALLBACK_FIELDS = ('accessKey', 'amount', 'extraData', 'message', 'orderId', 'orderInfo', 'orderType',
+                       'partnerCode', 'payType', 'requestId', 'responseTime', 'resultCode', 'transId')
+
+    def new_order_id(self):
+        return f'MM{int(time.time() * 1000)}{random.randint(100, 999)}'
+
+    def build_request(self, order_id, amount, description, metadata=None):
+        c = self.config
+        request_id = f"{c['partner_code']}{order_id}"
+        ipn_url = self.callback_url or c['ipn_url']
+        extra_data = base64.b64encode(json.dumps(metadata).encode()).decode() if metadata else ''
+        raw_signature = (
+            f"accessKey={c['access_key']}&amount={amount}&extraData={extra_data}&ipnUrl={ipn_url}"
+            f"&orderId={order_id}&orderInfo={description}&partnerCode={c['partner_code']}"
+            f"&redirectUrl={c['redirect_url']}&requestId={request_id}&requestType={c['request_type']}")
+        return {'json': {
+            'partnerCode': c['partner_code'],
+            'accessKey': c['access_key'],
+            'requestId': request_id,
+            'amount': str(amount),
+            'orderId': order_id,
+            'orderInfo': description,
+            'redirectUrl': c['redirect_url'],
+            'ipnUrl': ipn_url,
+            'extraData': extra_data,
+            'requestType': c['request_type'],
+            'signature': sign(c['secret_key'], raw_signature),
+            'lang': 'vi',
+        }}
+
+    def parse_response(self, status_code, payload):
+        if status_code != 200 or payload.get('resultCode', 0) != 0:
+            raise GatewayResponseError(
+                payload.get('message') or f'Failed to create payment request. Status code: {status_code}',
+                status_code, payload)
+        return {'provider': self.name, 'order_id': payload.get('orderId'), 'pay_url': payload.get('payUrl'),
+                'raw': payload}
+
+    def callback_signature(self, payload):
+        fields = {**payload, 'accessKey': self.config['access_key']}
+        return sign(self.config['secret_key'], '&'.join(f'{k}={fields.get(k, "")}' for k in self.CALLBACK_FIELDS))
+
+    def parse_callback(self, payload):
+        if not hmac.compare_digest(self.callback_signature(payload), str(payload.get('signature') or '')):
+            raise InvalidCallback('Invalid signature')
+        try:
+            metadata = json.loads(base64.b64decode(payload.get('extraData') or '') or '{}')
+            amount = int(payload['amount'])
+        except (KeyError, ValueError, TypeError):
+            raise InvalidCallback('Malformed callback')
+        return {'order_id': payload.get('orderId'), 'transaction_id': str(payload.get('transId', '')),
+                'amount': amount, 'paid': str(payload.get('resultCode')) == '0', 'metadata': metadata}
+
+    def callback_response(self, error=None):
+        # MoMo only needs an empty 204 acknowledgement; anything else makes it retry the IPN.
+        if error is None:
+            return 204, None
+        return 400, {'message': str(error)}
+
+
+class ZaloPayProvider(PaymentProvider):
+    name = 'zalopay'
+    description = 'pay with ZaloPay'
+    config = zalopay_config
+
+    def new_order_id(self):
+        return f"{datetime.now():%y%m%d}_{int(time.time() * 1000)}{random.randint(100, 999)}"
+
+    def build_request(self, order_id, amount, description, metadata=None):
+        c = self.config
+        order = {
+            'app_id': c['app_id'],
+            'app_trans_id': order_id,
+            'app_user': 'apartment',
+            'app_time': int(time.time() * 1000),
+            'amount': int(amount),
+            'embed_data': json.dumps(metadata or {}),
+            'item': '[]',
+            'description': description,
+        }
+        if self.callback_url:
+            order['callback_url'] = self.callback_url
+        raw = '|'.join(str(order[k]) for k in
+                       ('app_id', 'app_trans_id', 'app_user', 'amount', 'app_time', 'embed_data', 'item'))
+        order['mac'] = sign(c['key1'], raw)
+        return {'data': order}
+
+    def parse_response(self, status_code, payload):
+        if status_code != 200 or payload.get('return_code') != 1:
+            raise GatewayResponseError(
+                payload.get('return_message') or f'Failed to create payment request. Status code: {status_code}',
+                status_code, payload)
+        return {'provider': self.name, 'order_id': payload.get('app_trans_id'), 'pay_url': payload.get('order_url'),
+                'raw': payload}
+
+    def parse_callback(self, payload):
+        data = payload.get('data') or ''
+        if not verify(self.config['key2'], data, payload.get('mac')):
+            raise InvalidCallback('mac not equal')
+        try:
+            data = json.loads(data)
+            metadata = json.loads(data.get('embed_data') or '{}')
+            amount = int(data['amount'])
+        except (KeyError, ValueError, TypeError):
+            raise InvalidCallback('Malformed callback')
+        # ZaloPay only calls back for successful transactions.
+        return {'order_id': data.get('app_trans_id'), 'transaction_id': str(data.get('zp_trans_id', '')),
+                'amount': amount, 'paid': True, 'metadata': metadata}
+
+    def callback_response(self, error=None):
+        if error is None:
+            return 200, {'return_code': 1, 'return_message': 'success'}
+        return 200, {'return_code': -1, 'return_message': str(error)}
+
+
+PROVIDERS = {provider.name: provider for provider in (MomoProvider, ZaloPayProvider)}
+
+
+def get_provider(name):
+    if name not in PROVIDERS:
+        raise GatewayError(f'Unknown payment provider: {name}')
+    return PROVIDERS[name](PAYMENT_GATEWAY['endpoints'].get(name), PAYMENT_GATEWAY['callback_urls'].get(name))
+
+
+class BaseGatewayClient:
+    def __init__(self, provider, options=None, breaker=None):
+        self.provider = provider
+        self.options = {**PAYMENT_GATEWAY, **(options or {})}
+        self.breaker = breaker or CircuitBreaker(self.options['failure_threshold'], self.options['reset_timeout'])
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retrying workers from hitting a recovering gateway in lockstep.
+        return random.uniform(0, min(self.options['backoff_max'], self.options['backoff'] * 2 ** attempt))
+
+    def _start(self):
+        allowed = self.breaker.allow()
+        if not allowed:
+            raise GatewayUnavailable(f'{self.provider.name} gateway circuit is open')
+        return time.monotonic() + self.options['deadline'], allowed == CircuitBreaker.HALF_OPEN
+
+    def _timeouts(self, deadline):
+        remaining = deadline - time.monotonic()
+        return min(self.options['connect_timeout'], remaining), min(self.options['read_timeout'], remaining)
+
+    def _retry_pause(self, attempt, error, deadline):
+        name = self.provider.name
+        pause = self._backoff(attempt - 1)
+        if attempt > self.options['retries'] or time.monotonic() + pause >= deadline:
+            self.breaker.record_failure()
+            logger.warning('%s gateway failed after %d attempts: %s', name, attempt, error)
+            raise GatewayUnavailable(f'{name} gateway is unavailable') from error
+        logger.info('%s gateway attempt %d failed (%s), retrying in %.2fs', name, attempt, error, pause)
+        return pause
+
+    def _status_error(self, status_code):
+        return GatewayResponseError(f'{self.provider.name} gateway returned {status_code}', status_code)
+
+    def _request(self, amount, description, order_id, metadata):
+        return self.provider.build_request(order_id or self.provider.new_order_id(), amount, description, metadata)
+
+
+class GatewayClient(BaseGatewayClient):
+    def __init__(self, provider, options=None, breaker=None):
+        super().__init__(provider, options, breaker)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.options['pool_size'])
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def create_payment(self, amount, description, order_id=None, metadata=None):
+        status_code, payload = self.send(self._request(amount, description, order_id, metadata))
+        return self.provider.parse_response(status_code, payload)
+
+    async def acreate_payment(self, amount, description, order_id=None, metadata=None):
+        # Thread-sensitive, so under WSGI the call runs back in the worker thread that async_to_sync is blocking.
+        return await sync_to_async(self.create_payment)(amount, description, order_id, metadata)
+
+    def send(self, body):
+        deadline, probe = self._start()
+        try:
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    response = self.session.post(self.provider.endpoint, timeout=self._timeouts(deadline), **body)
+                except requests.RequestException as e:
+                    error = e
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        self.breaker.record_success()
+                        try:
+                            return response.status_code, response.json()
+                        except ValueError:
+                            return response.status_code, {}
+                    error = self._status_error(response.status_code)
+                time.sleep(self._retry_pause(attempt, error, deadline))
+        finally:
+            if probe:
+                self.breaker.release_probe()
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncGatewayClient(BaseGatewayClient):
+    def __init__(self, provider, options=None, breaker=None):
+        super().__init__(provider, options, breaker)
+        self._loop = None
+        self._session = None
+
+    async def session(self):
+        # aiohttp sessions are bound to the loop that created them; each ASGI worker runs a single loop.
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            if self._session is not None and not self._session.closed:
+                # Closing drops the old loop's pooled sockets (a no-op once that loop is closed) so they don't leak.
+                await self._session.close()
+            connector = aiohttp.TCPConnector(limit=self.options['async_pool_size'])
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._loop = loop
+        return self._session
+
+    async def create_payment(self, amount, description, order_id=None, metadata=None):
+        status_code, payload = await self.send(self._request(amount, description, order_id, metadata))
+        return self.provider.parse_response(status_code, payload)
+
+    acreate_payment = create_payment
+
+    async def send(self, body):
+        deadline, probe = self._start()
+        try:
+            attempt = 0
+            while True:
+                attempt += 1
+                connect, read = self._timeouts(deadline)
+                timeout = aiohttp.ClientTimeout(total=deadline - time.monotonic(), sock_connect=connect,
+                                                sock_read=read)
+                try:
+                    session = await self.session()
+                    async with session.post(self.provider.endpoint, timeout=timeout, **body) as response:
+                        if response.status not in RETRY_STATUSES:
+                            self.breaker.record_success()
+                            try:
+                                return response.status, await response.json(content_type=None)
+                            except ValueError:
+                                return response.status, {}
+                        error = self._status_error(response.status)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = e
+                await asyncio.sleep(self._retry_pause(attempt, error, deadline))
+        finally:
+            if probe:
+                self.breaker.release_probe()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+_clients = {}
+_async_clients = {}
+_breakers = {}
+_clients_lock = threading.Lock()
+
+
+def _get_client(registry, cls, name):
+    with _clients_lock:
+        if name not in registry:
+            provider = get_provider(name)
+            if name not in _breakers:
+                _breakers[name] = CircuitBreaker(PAYMENT_GATEWAY['failure_threshold'], PAYMENT_GATEWAY['reset_timeout'])
+            registry[name] = cls(provider, breaker=_breakers[name])
+        return registry[name]
+
+
+def get_gateway(name='momo'):
+    return _get_client(_clients, GatewayClient, name)
+
+
+def get_async_gateway(name='momo'):
+    # Shares the circuit breaker with the sync client so both paths see the same gateway health.
+    return _get_client(_async_clients, AsyncGatewayClient, name)
+
+
+def get_request_gateway(request, name='momo'):
+    # Under WSGI every async view runs in a new event loop (async_to_sync), where an aiohttp session could never
+    # be reused; the pooled requests session is used there instead. Both expose acreate_payment().
+    if isinstance(request, ASGIRequest):
+        return get_async_gateway(name)
+    return get_gateway(name)
+
+
+def reset_gateways():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        _async_clients.clear()
+        _breakers.clear()
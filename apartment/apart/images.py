@@ -0,0 +1,75 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MAX_SIZE = getattr(settings, 'IMAGE_MAX_SIZE', 1600)
+IMAGE_QUALITY = getattr(settings, 'IMAGE_QUALITY', 82)
+IMAGE_PROCESSES = getattr(settings, 'IMAGE_PROCESSES', 2)
+THUMBNAIL_SIZES = getattr(settings, 'THUMBNAIL_SIZES', {'list': (160, 160), 'detail': (640, 640)})
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _flatten(image):
+    if not _has_alpha(image):
+        return image.convert('RGB')
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+    return background
+
+
+def process_image(path, max_size, quality, thumbnail_sizes):
+    stem = os.path.splitext(path)[0]
+    with Image.open(path) as original:
+        icc_profile = original.info.get('icc_profile')
+        # Apply the EXIF orientation before the metadata is dropped, otherwise phone photos end up sideways.
+        image = ImageOps.exif_transpose(original)
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+
+    # Nothing is copied from the source's EXIF block, so GPS and camera data never leave the server.
+    # The spooled original is left in place: it is still served while the upload is pending.
+    if _has_alpha(image):
+        output = f'{stem}_full.png'
+        image.save(output, 'PNG', optimize=True, icc_profile=icc_profile)
+    else:
+        output = f'{stem}_full.jpg'
+        image.convert('RGB').save(output, 'JPEG', quality=quality, optimize=True, progressive=True,
+                                  icc_profile=icc_profile)
+
+    flat = _flatten(image)
+    thumbnails = {}
+    for name, size in thumbnail_sizes.items():
+        thumbnail = ImageOps.fit(flat, tuple(size), Image.LANCZOS)
+        thumbnails[name] = f'{stem}_{name}.jpg'
+        thumbnail.save(thumbnails[name], 'JPEG', quality=quality, optimize=True, progressive=True)
+    return output, thumbnails
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the parent is a threaded server holding DB connections and locks.
+            # Children import only this module, which must stay free of model and Cloudinary imports.
+            _pool = ProcessPoolExecutor(max_workers=IMAGE_PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def prepare_image(path):
+    args = (path, IMAGE_MAX_SIZE, IMAGE_QUALITY, THUMBNAIL_SIZES)
+    if not IMAGE_PROCESSES:
+        return process_image(*args)
+    return _get_pool().submit(process_image, *args).result()
@@ -0,0 +1,117 @@
+import threading
+import time
+from importlib import import_module
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from oauth2_provider.models import AccessToken, RefreshToken
+
+from .caches import is_shared
+from .models import Resident, UserSession
+
+VERSION_KEY = 'locks:version'
+
+SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
+
+
+class LockState:
+    def __init__(self):
+        self.version = None
+        self.locked = frozenset()
+        self._lock = threading.Lock()
+
+    def sync(self, version):
+        with self._lock:
+            if version != self.version:
+                # Locked accounts are rare, so the whole set is reloaded instead of diffed.
+                self.locked = frozenset(Resident.objects.filter(is_active=False).values_list('id', flat=True))
+                self.version = version
+            return self.locked
+
+
+_state = LockState()
+
+
+def lock_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted counter never reuses an old version.
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_lock_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time() * 1000), None)
+
+
+def locked_ids():
+    version = lock_version()
+    if version == _state.version:
+        return _state.locked
+    return _state.sync(version)
+
+
+def is_locked(user_id):
+    if not is_shared():
+        # The version only reaches other workers through a shared cache; without one, ask the database.
+        return Resident.objects.filter(pk=user_id, is_active=False).exists()
+    return user_id in locked_ids()
+
+
+def register_session(user, session_key):
+    if session_key:
+        UserSession.objects.update_or_create(session_key=session_key, defaults={'user': user})
+
+
+def unregister_session(session_key):
+    if session_key:
+        UserSession.objects.filter(session_key=session_key).delete()
+
+
+def end_sessions(user_id):
+    sessions = list(UserSession.objects.filter(user_id=user_id).values_list('session_key', flat=True))
+    for session_key in sessions:
+        # Through the store, not the table: cached_db would keep serving the session from cache.
+        SessionStore(session_key).delete()
+    UserSession.objects.filter(session_key__in=sessions).delete()
+    return len(sessions)
+
+
+def revoke_tokens(user_id):
+    RefreshToken.objects.filter(user_id=user_id).delete()
+    # Per-row delete so access_token_changed drops each token from the authentication cache.
+    AccessToken.objects.filter(user_id=user_id).delete()
+    if apps.is_installed('rest_framework.authtoken'):
+        from rest_framework.authtoken.models import Token
+        Token.objects.filter(user_id=user_id).delete()
+
+
+def evict_user(user_id):
+    end_sessions(user_id)
+    revoke_tokens(user_id)
+
+
+def lock_state_changed(user_id, locked):
+    if locked:
+        evict_user(user_id)
+    transaction.on_commit(bump_lock_version)
+
+
+def record_resident_saved(resident, created):
+    # Compared with is_active as loaded, not with locked_ids(): on a worker with a stale set that call reloads
+    # from the database, which already holds this save. None (deferred or built by hand) counts as a change.
+    was_active = True if created else getattr(resident, '_loaded_is_active', None)
+    if was_active != resident.is_active:
+        lock_state_changed(resident.pk, not resident.is_active)
+    resident._loaded_is_active = resident.is_active
+
+
+def lock_resident(user):
+    user.is_active = False
+    user.save(update_fields=['is_active'])
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apart.pricing import UTILITY_TARIFFS, bill_meter_readings
+
+
+class Command(BaseCommand):
+    help = 'Price every meter reading of a period with the tiered utility tariffs and create the bills.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', required=True, help='Billing period as YYYY-MM.')
+        parser.add_argument('--kind', action='append', dest='kinds', choices=list(UTILITY_TARIFFS),
+                            help='Only bill this meter kind; repeat for several. Defaults to all.')
+
+    def handle(self, *args, **options):
+        try:
+            result = bill_meter_readings(options['period'], options['kinds'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Period {result['period']}: priced {result['meters']} meters, {result['created']} bills created, "
+            f"{result['skipped']} already existed."))
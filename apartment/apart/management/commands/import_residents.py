@@ -0,0 +1,35 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from apart.onboarding import RESIDENT_IMPORT_CHUNK_SIZE, import_residents, parse_residents
+
+
+class Command(BaseCommand):
+    help = 'Create residents (and their family members) in bulk from a CSV or JSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV with a header row, or JSON list of residents.')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Defaults to the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=RESIDENT_IMPORT_CHUNK_SIZE)
+        parser.add_argument('--processes', type=int,
+                            help='Worker processes used to hash passwords (defaults to PASSWORD_HASH_PROCESSES).')
+
+    def handle(self, *args, **options):
+        format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        try:
+            with open(options['path'], 'rb') as f:
+                rows = parse_residents(f.read(), format)
+            result = import_residents(rows, chunk_size=options['chunk_size'], processes=options['processes'],
+                                      progress=self.report_progress)
+        except (OSError, ValueError, UnicodeError, IntegrityError) as e:
+            raise CommandError(str(e))
+
+        for row in result['results']:
+            if row['status'] == 'error':
+                self.stderr.write(f"Row {row['index']} ({row['username']}): {row['error']}")
+        self.stdout.write(self.style.SUCCESS(f"{result['created']} residents created, {result['failed']} rejected."))
+
+    def report_progress(self, done, total):
+        self.stdout.write(f'{done}/{total} residents inserted')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from apart.models import PendingUpload
+from apart.uploads import process_upload, requeue_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Upload spooled media that is still pending (e.g. after a restart) and retry failed uploads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-failed', action='store_true', help='Leave FAILED uploads alone.')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_uploads()
+        if requeued:
+            self.stdout.write(f'{requeued} stale uploads requeued.')
+
+        statuses = ['PENDING'] if options['no_failed'] else ['PENDING', 'FAILED']
+        results = {}
+        for upload_id in PendingUpload.objects.filter(status__in=statuses).order_by('id').values_list('id', flat=True):
+            status = process_upload(upload_id)
+            if status:
+                results[status] = results.get(status, 0) + 1
+        summary = ', '.join(f'{n} {status.lower()}' for status, n in sorted(results.items())) or 'nothing to do'
+        self.stdout.write(self.style.SUCCESS(f'Uploads processed: {summary}.'))
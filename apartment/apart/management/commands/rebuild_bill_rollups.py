@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apart.rollups import diff_bill_rollups, rebuild_bill_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild BillRollup rows from the Bill table, or check them against live counts with --check.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only compare rollups with live counts.')
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            count = rebuild_bill_rollups()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} bill rollups.'))
+
+        mismatches = diff_bill_rollups()
+        for mismatch in mismatches:
+            self.stdout.write(f"resident={mismatch['resident_id']} expected={mismatch['expected']} "
+                              f"actual={mismatch['actual']}")
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} bill rollups do not match live counts.')
+        self.stdout.write(self.style.SUCCESS('Bill rollups match live counts.'))
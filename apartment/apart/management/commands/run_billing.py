@@ -0,0 +1,33 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apart.billing import BILLING_CHUNK_SIZE, BillingConflict, parse_charges, run_billing
+
+
+class Command(BaseCommand):
+    help = 'Generate the monthly bills of every active resident for a period (idempotent per bill type).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', required=True, help='Billing period as YYYY-MM.')
+        parser.add_argument('--charge', action='append', required=True, dest='charges',
+                            help='"<bill type>=<amount>", repeat for each bill type.')
+        parser.add_argument('--issue-date', type=date.fromisoformat, help='Defaults to the first day of the period.')
+        parser.add_argument('--due-date', type=date.fromisoformat, help='Defaults to the last day of the period.')
+        parser.add_argument('--chunk-size', type=int, default=BILLING_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            charges = parse_charges(options['charges'])
+            result = run_billing(options['period'], charges, issue_date=options['issue_date'],
+                                 due_date=options['due_date'], chunk_size=options['chunk_size'],
+                                 progress=self.report_progress)
+        except (ValueError, BillingConflict) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Period {result['period']}: {result['created']} bills created, {result['skipped']} already existed "
+            f"for {result['residents']} residents."))
+
+    def report_progress(self, done, total, created):
+        self.stdout.write(f'{done}/{total} residents processed, {created} bills created')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from apart.stub_gateway import StubGatewayServer
+
+
+class Command(BaseCommand):
+    help = ('Serve a local stand-in for the MoMo and ZaloPay create endpoints. Point '
+            'PAYMENT_GATEWAY["endpoints"] at it to exercise payments without the sandbox.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--delay', type=float, default=0, help='Seconds to wait before every response.')
+        parser.add_argument('--fail', type=int, default=0, help='Answer the first N requests with a 503.')
+
+    def handle(self, *args, **options):
+        server = StubGatewayServer(options['host'], options['port'], delay=options['delay'],
+                                   fail_next=options['fail'], verbose=True)
+        self.stdout.write(self.style.SUCCESS(f'Stub payment gateway listening on {server.url}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,83 @@
+import os
+from functools import lru_cache
+
+from cloudinary import CloudinaryResource
+from cloudinary.models import CloudinaryField
+from django.conf import settings
+
+from .images import THUMBNAIL_SIZES
+
+MEDIA_URL_CACHE_SIZE = getattr(settings, 'MEDIA_URL_CACHE_SIZE', 8192)
+
+# Public ids under this prefix are files in MEDIA_ROOT (pending uploads and the filesystem backend).
+LOCAL_PREFIX = 'local/'
+PENDING_DIR = 'uploads/pending'
+
+_parser = CloudinaryField()
+
+
+@lru_cache(maxsize=MEDIA_URL_CACHE_SIZE)
+def _build_url(public_id, version, format, type, resource_type, transformation):
+    resource = CloudinaryResource(public_id=public_id, version=version, format=format, type=type,
+                                  resource_type=resource_type or 'image')
+    return resource.build_url(**dict(transformation))
+
+
+def as_resource(resource):
+    if not resource:
+        return None
+    if isinstance(resource, str):
+        return _parser.parse_cloudinary_resource(resource)
+    if isinstance(resource, CloudinaryResource):
+        return resource
+    return None
+
+
+def local_path(resource):
+    resource = as_resource(resource)
+    if resource is None or not resource.public_id.startswith(LOCAL_PREFIX):
+        return None
+    name = resource.public_id[len(LOCAL_PREFIX):]
+    return f'{name}.{resource.format}' if resource.format else name
+
+
+def media_status(resource):
+    resource = as_resource(resource)
+    if resource is None:
+        return None
+    return 'PENDING' if resource.public_id.startswith(LOCAL_PREFIX + PENDING_DIR) else 'READY'
+
+
+def media_url(resource, request=None, **transformation):
+    resource = as_resource(resource)
+    if resource is None:
+        return None
+    path = local_path(resource)
+    if path is not None:
+        url = settings.MEDIA_URL + path
+    else:
+        url = _build_url(resource.public_id, resource.version, resource.format, resource.type,
+                         resource.resource_type, tuple(sorted(transformation.items())))
+    if request and url.startswith('/'):
+        return request.build_absolute_uri(url)
+    return url
+
+
+def thumbnail_transformation(size):
+    width, height = THUMBNAIL_SIZES[size]
+    return {'width': width, 'height': height, 'crop': 'fill'}
+
+
+def thumbnail_url(resource, request=None, size='list'):
+    resource = as_resource(resource)
+    if resource is None:
+        return None
+    path = local_path(resource)
+    if path is None:
+        # Same transformation the upload requested eagerly, so Cloudinary serves the pre-built derivative.
+        return media_url(resource, request, **thumbnail_transformation(size))
+    derivative = f'{os.path.splitext(path)[0]}_{size}.jpg'
+    if not os.path.exists(os.path.join(settings.MEDIA_ROOT, derivative)):
+        return media_url(resource, request)
+    url = settings.MEDIA_URL + derivative
+    return request.build_absolute_uri(url) if request and url.startswith('/') else url
@@ -1,13 +1,155 @@
-from django.contrib.auth import logout
-from django.shortcuts import redirect
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections
+from django.http import JsonResponse
+
+from . import locks
+
+logger = logging.getLogger(__name__)
+
 
 class CheckIsActiveMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self.is_locked(request):
+            return self.reject(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if await sync_to_async(self.is_locked)(request):
+            return await sync_to_async(self.reject)(request)
+        return await self.get_response(request)
+
+    def is_locked(self, request):
+        # Reads the user id straight from the session so request.user is never loaded just for this check.
+        user_id = request.session.get(SESSION_KEY)
+        if user_id is None:
+            return False
+        return locks.is_locked(get_user_model()._meta.pk.to_python(user_id))
+
+    def reject(self, request):
+        # Locking normally ends these sessions already; this covers any that were not in the registry.
+        request.session.flush()
+        request.user = AnonymousUser()
+        return JsonResponse({'error': 'Account is locked'}, status=401)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+
+
+def query_shape(sql):
+    shape = _LITERAL_RE.sub('?', sql.replace('%s', '?'))
+    return _IN_LIST_RE.sub('(?...)', shape)
+
+
+class QueryCollector:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[query_shape(sql)] += 1
+
+    def repeated(self, threshold):
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+    @contextmanager
+    def capture(self):
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+
+@contextmanager
+def assert_max_queries(limit):
+    collector = QueryCollector()
+    with collector.capture():
+        yield collector
+    if collector.count > limit:
+        raise QueryBudgetExceeded(
+            f'{collector.count} queries executed, budget is {limit}: {dict(collector.shapes)}')
+
+
+class QueryInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.n_plus_one_threshold = getattr(settings, 'QUERY_N_PLUS_ONE_THRESHOLD', 3)
+        self.budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        self.enforce_budgets = getattr(settings, 'QUERY_BUDGET_ENFORCE', False)
 
     def __call__(self, request):
-        if request.user.is_authenticated and not request.user.is_active:
-            logout(request)
-            return redirect('login')
-        response = self.get_response(request)
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        collector = QueryCollector()
+        with collector.capture():
+            response = self.get_response(request)
+        return self.report(request, response, collector)
+
+    async def __acall__(self, request):
+        collector = QueryCollector()
+        # Connections are per thread: the wrappers must go on the ones in the thread that runs this request's
+        # sync code (views, ORM calls via sync_to_async), not on this event-loop thread's.
+        stack = ExitStack()
+        await sync_to_async(stack.enter_context)(collector.capture())
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.report(request, response, collector)
+
+    def report(self, request, response, collector):
+        repeated = collector.repeated(self.n_plus_one_threshold)
+        response['X-DB-Query-Count'] = str(collector.count)
+        response['X-DB-Time-Ms'] = f'{collector.duration * 1000:.1f}'
+        if repeated:
+            response['X-DB-N-Plus-One'] = str(max(repeated.values()))
+
+        url_name = request.resolver_match.view_name if request.resolver_match else None
+        logger.info('%s %s view=%s queries=%d db_ms=%.1f n_plus_one=%d',
+                    request.method, request.path, url_name, collector.count,
+                    collector.duration * 1000, len(repeated))
+        for shape, n in repeated.items():
+            logger.warning('N+1 suspected on %s: %d x %s', request.path, n, shape)
+
+        budget = self.budgets.get(url_name)
+        if budget is not None and collector.count > budget:
+            message = f'{url_name} ran {collector.count} queries, budget is {budget}'
+            if self.enforce_budgets:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
         return response
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.3 on 2026-10-18 10:47
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_duplicate_cart_lines(apps, schema_editor):
+    CartProduct = apps.get_model('apart', 'CartProduct')
+    duplicates = (CartProduct.objects.values('cart_id', 'product_id')
+                  .annotate(lines=Count('id'), total=Sum('quantity'))
+                  .filter(lines__gt=1))
+    for row in duplicates:
+        lines = CartProduct.objects.filter(cart_id=row['cart_id'], product_id=row['product_id']).order_by('id')
+        keep = lines.first()
+        lines.exclude(id=keep.id).delete()
+        CartProduct.objects.filter(id=keep.id).update(quantity=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apart', '0018_order_orderproduct_delete_billproduct'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartproduct',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_product'),
+        ),
+    ]
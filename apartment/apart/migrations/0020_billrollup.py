@@ -0,0 +1,42 @@
+# Generated by Django 5.0.3 on 2026-10-18 10:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_bill_rollups(apps, schema_editor):
+    Bill = apps.get_model('apart', 'Bill')
+    BillRollup = apps.get_model('apart', 'BillRollup')
+    rollups = {None: BillRollup(resident_id=None)}
+    rows = Bill.objects.values('resident_id', 'payment_status').annotate(n=Count('id'), total=Sum('amount'))
+    for row in rows:
+        prefix = 'paid' if row['payment_status'] == 'PAID' else 'unpaid'
+        for resident_id in (row['resident_id'], None):
+            rollup = rollups.setdefault(resident_id, BillRollup(resident_id=resident_id))
+            setattr(rollup, f'{prefix}_count', getattr(rollup, f'{prefix}_count') + row['n'])
+            setattr(rollup, f'{prefix}_amount', getattr(rollup, f'{prefix}_amount') + (row['total'] or 0))
+    BillRollup.objects.bulk_create(rollups.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apart', '0019_cartproduct_unique_cart_product'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paid_count', models.IntegerField(default=0)),
+                ('unpaid_count', models.IntegerField(default=0)),
+                ('paid_amount', models.DecimalField(decimal_places=0, default=0, max_digits=14)),
+                ('unpaid_amount', models.DecimalField(decimal_places=0, default=0, max_digits=14)),
+                ('resident', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bill_rollup', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(populate_bill_rollups, migrations.RunPython.noop),
+    ]
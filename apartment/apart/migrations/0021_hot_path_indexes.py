@@ -0,0 +1,45 @@
+# Generated by Django 5.0.3 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apart', '0020_billrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['resident', 'payment_status'], name='bill_resident_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['payment_status'], name='bill_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['resident', 'resolved'], name='feedback_resident_resolved_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['resolved'], name='feedback_resolved_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['resident', 'status'], name='item_resident_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['status'], name='item_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['resident', 'status'], name='order_resident_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='surveyresult',
+            index=models.Index(fields=['survey', 'cleanliness_rating', 'facilities_rating', 'services_rating'], name='surveyresult_ratings_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.3 on 2026-10-18 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apart', '0021_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='period',
+            field=models.CharField(blank=True, max_length=7, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='bill',
+            constraint=models.UniqueConstraint(fields=('resident', 'period', 'bill_type'), name='unique_bill_period_type'),
+        ),
+    ]
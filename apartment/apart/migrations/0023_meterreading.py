@@ -0,0 +1,35 @@
+# Generated by Django 5.0.3 on 2026-10-18 10:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apart', '0022_bill_period'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeterReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=7)),
+                ('kind', models.CharField(choices=[('E', 'Điện'), ('W', 'Nước')], max_length=1)),
+                ('previous', models.PositiveIntegerField()),
+                ('current', models.PositiveIntegerField()),
+                ('flat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meter_readings', to='apart.flat')),
+                ('resident', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='meterreading',
+            constraint=models.UniqueConstraint(fields=('period', 'kind', 'flat'), name='unique_meter_reading'),
+        ),
+        migrations.AddConstraint(
+            model_name='meterreading',
+            constraint=models.CheckConstraint(check=models.Q(('current__gte', models.F('previous'))), name='meter_reading_not_negative'),
+        ),
+    ]
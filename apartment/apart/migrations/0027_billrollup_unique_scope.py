@@ -0,0 +1,27 @@
+# Generated by Django 5.0.3 on 2026-10-18 11:58
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+def drop_duplicate_global_rollups(apps, schema_editor):
+    # Concurrent get_or_create(resident=None) calls could each insert a global row; every writer updated all of
+    # them, so the oldest already holds the full totals.
+    BillRollup = apps.get_model('apart', 'BillRollup')
+    ids = list(BillRollup.objects.filter(resident__isnull=True).order_by('id').values_list('id', flat=True))
+    BillRollup.objects.filter(id__in=ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apart', '0026_usersession'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_global_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='billrollup',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('resident', models.Value(0)), name='unique_bill_rollup_scope'),
+        ),
+    ]
@@ -1,10 +1,21 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
+from django.contrib.contenttypes.models import ContentType
 from cloudinary.models import CloudinaryField
 class Resident(AbstractUser):
     avatar = CloudinaryField('avatar',null=True)
     phone = models.CharField(max_length= 13, null = True, blank = True)
     is_active = models.BooleanField(default=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'is_active' in field_names:
+            instance._loaded_is_active = instance.is_active
+        return instance
+
     def __str__(self):
         return self.username
 
@@ -25,6 +36,11 @@ class CartProduct(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
     def __str__(self):
         return f"{self.cart.resident.username}'s Cart - {self.product.name}"
 class Order(models.Model):
@@ -39,6 +55,11 @@ class Order(models.Model):
     ]
     status = models.CharField(max_length=30, choices=status_choices, default='ĐANG CHỜ')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['resident', 'status'], name='order_resident_status_idx'),
+        ]
+
     def __str__(self):
         return f'Order {self.id} - {self.status}'
 
@@ -63,11 +84,70 @@ class Bill(models.Model):
     ]
     payment_status = models.CharField(max_length=10, choices=status_choices, default='UNPAID')
     image = CloudinaryField('image', null=True)
+    period = models.CharField(max_length=7, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['resident', 'payment_status'], name='bill_resident_status_idx'),
+            models.Index(fields=['payment_status'], name='bill_status_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['resident', 'period', 'bill_type'], name='unique_bill_period_type'),
+        ]
+
+    ROLLUP_STATE_FIELDS = ('resident_id', 'payment_status', 'amount')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._rollup_loaded = {name: getattr(instance, name) for name in cls.ROLLUP_STATE_FIELDS
+                                   if name in field_names}
+        if len(instance._rollup_loaded) == len(cls.ROLLUP_STATE_FIELDS):
+            instance._rollup_state = tuple(instance._rollup_loaded[name] for name in cls.ROLLUP_STATE_FIELDS)
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Keep the BillRollup update (post_save) in the same transaction as the row write.
+        with transaction.atomic():
+            if not self._state.adding and getattr(self, '_rollup_state', None) is None:
+                self._rollup_state = self._stored_rollup_state()
+            super().save(*args, **kwargs)
+
+    def _stored_rollup_state(self):
+        # Loaded with .only()/defer(): the fields left out may have been assigned since, so their stored values
+        # are read from the row; without them the rollup would count this bill as new.
+        loaded = getattr(self, '_rollup_loaded', {})
+        missing = [name for name in self.ROLLUP_STATE_FIELDS if name not in loaded]
+        stored = Bill.objects.select_for_update().filter(pk=self.pk).values(*missing).first()
+        if stored is None:
+            return None
+        return tuple({**loaded, **stored}[name] for name in self.ROLLUP_STATE_FIELDS)
 
     def __str__(self):
         return self.bill_type
 
 
+class BillRollup(models.Model):
+    resident = models.OneToOneField(Resident, on_delete=models.CASCADE, null=True, related_name='bill_rollup')
+    paid_count = models.IntegerField(default=0)
+    unpaid_count = models.IntegerField(default=0)
+    paid_amount = models.DecimalField(max_digits=14, decimal_places=0, default=0)
+    unpaid_amount = models.DecimalField(max_digits=14, decimal_places=0, default=0)
+
+    class Meta:
+        constraints = [
+            # NULLs never collide in a unique index, so the single all-residents row is keyed on resident_id or 0.
+            models.UniqueConstraint(Coalesce('resident', Value(0)), name='unique_bill_rollup_scope'),
+        ]
+
+    @property
+    def total_count(self):
+        return self.paid_count + self.unpaid_count
+
+    def __str__(self):
+        return f'Bill rollup - {self.resident or "all residents"}'
+
+
 class Flat(models.Model):
     number = models.CharField(max_length=10)
     floor = models.IntegerField()
@@ -75,6 +155,31 @@ class Flat(models.Model):
     def __str__(self):
         return self.number
 
+class MeterReading(models.Model):
+    kind_choices = [
+        ('E', 'Điện'),
+        ('W', 'Nước'),
+    ]
+    flat = models.ForeignKey(Flat, on_delete=models.CASCADE, related_name='meter_readings')
+    resident = models.ForeignKey(Resident, on_delete=models.CASCADE)
+    period = models.CharField(max_length=7)
+    kind = models.CharField(max_length=1, choices=kind_choices)
+    previous = models.PositiveIntegerField()
+    current = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'kind', 'flat'], name='unique_meter_reading'),
+            models.CheckConstraint(check=models.Q(current__gte=models.F('previous')), name='meter_reading_not_negative'),
+        ]
+
+    @property
+    def usage(self):
+        return self.current - self.previous
+
+    def __str__(self):
+        return f'{self.flat} - {self.get_kind_display()} {self.period}'
+
 class Item(models.Model):
     resident = models.ForeignKey(Resident, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
@@ -84,6 +189,12 @@ class Item(models.Model):
     ]
     status = models.CharField(max_length=10, choices=status_choices, default='PENDING')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['resident', 'status'], name='item_resident_status_idx'),
+            models.Index(fields=['status'], name='item_status_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -102,6 +213,12 @@ class Feedback(models.Model):
     created_date = models.DateTimeField(auto_now_add=True)
     resolved = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['resident', 'resolved'], name='feedback_resident_resolved_idx'),
+            models.Index(fields=['resolved'], name='feedback_resolved_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -121,6 +238,61 @@ class SurveyResult(models.Model):
     services_rating = models.PositiveIntegerField()
     submitted_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Covers the analytics scan so it never touches the table rows.
+            models.Index(fields=['survey', 'cleanliness_rating', 'facilities_rating', 'services_rating'],
+                         name='surveyresult_ratings_idx'),
+        ]
+
     def __str__(self):
         return self.survey.title
 
+
+class PendingUpload(models.Model):
+    status_choices = [
+        ('PENDING', 'Pending'),
+        ('UPLOADING', 'Uploading'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+        ('CANCELLED', 'Cancelled'),
+    ]
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    field_name = models.CharField(max_length=50)
+    local_id = models.CharField(max_length=255)
+    sha256 = models.CharField(max_length=64, blank=True, default='')
+    public_id = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=status_choices, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='pendingupload_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.content_type.model}:{self.object_id}.{self.field_name} ({self.status})'
+
+
+class MediaAsset(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True)
+    public_id = models.CharField(max_length=255, unique=True)
+    value = models.CharField(max_length=255)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.public_id} ({self.ref_count} refs)'
+
+
+class UserSession(models.Model):
+    user = models.ForeignKey(Resident, on_delete=models.CASCADE, related_name='sessions')
+    session_key = models.CharField(max_length=40, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.user_id}:{self.session_key}'
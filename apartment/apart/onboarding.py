@@ -0,0 +1,143 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .dashboard import invalidate_dashboard
+from .models import FaMember, Resident
+from .passwords import hash_passwords, is_password_hash
+
+RESIDENT_IMPORT_CHUNK_SIZE = getattr(settings, 'RESIDENT_IMPORT_CHUNK_SIZE', 1000)
+RESIDENT_IMPORT_LIMIT = getattr(settings, 'RESIDENT_IMPORT_LIMIT', 50)
+
+RESIDENT_FIELDS = ['username', 'first_name', 'last_name', 'email', 'phone']
+
+
+def parse_family_members(value):
+    # CSV cell: "name:numberXe;name:numberXe". JSON rows carry a list of {"name", "numberXe"} objects instead.
+    if isinstance(value, list):
+        return value
+    members = []
+    for entry in str(value or '').split(';'):
+        if entry.strip():
+            name, _, number = entry.partition(':')
+            members.append({'name': name.strip(), 'numberXe': number.strip()})
+    return members
+
+
+def parse_residents(content, format):
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    if format == 'json':
+        rows = json.loads(content)
+        if isinstance(rows, dict):
+            rows = rows.get('residents')
+        if not isinstance(rows, list):
+            raise ValueError('JSON must be a list of residents or {"residents": [...]}')
+        return rows
+    if format == 'csv':
+        return [{k.strip(): v for k, v in row.items() if k} for row in csv.DictReader(io.StringIO(content))]
+    raise ValueError(f'Unsupported format "{format}", use csv or json')
+
+
+def _text(row, name):
+    value = row.get(name)
+    return '' if value is None else str(value).strip()
+
+
+def _max_length(model, name):
+    return model._meta.get_field(name).max_length
+
+
+def _validate_row(row):
+    username = _text(row, 'username')
+    if not username:
+        return 'username is required'
+    try:
+        Resident.username_validator(username)
+    except ValidationError as e:
+        return e.messages[0]
+    for name in RESIDENT_FIELDS:
+        if len(_text(row, name)) > _max_length(Resident, name):
+            return f'{name} is longer than {_max_length(Resident, name)} characters'
+    if not _text(row, 'password') and not _text(row, 'password_hash'):
+        return 'password or password_hash is required'
+    if _text(row, 'password_hash') and not is_password_hash(_text(row, 'password_hash')):
+        return 'password_hash is not a recognised Django password hash'
+    members = parse_family_members(row.get('family_members'))
+    for member in members:
+        if not isinstance(member, dict) or not _text(member, 'name'):
+            return 'every family member needs a name'
+        if len(_text(member, 'name')) > _max_length(FaMember, 'name') or \
+                len(_text(member, 'numberXe')) > _max_length(FaMember, 'numberXe'):
+            return f'family member "{_text(member, "name")}" has a field that is too long'
+    return None
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def import_residents(rows, chunk_size=RESIDENT_IMPORT_CHUNK_SIZE, processes=None, progress=None):
+    results = [{'index': index, 'username': _text(row, 'username') if isinstance(row, dict) else ''}
+               for index, row in enumerate(rows)]
+    valid = []
+    seen = set()
+    for result, row in zip(results, rows):
+        error = _validate_row(row) if isinstance(row, dict) else 'row must be an object'
+        # MySQL's default collation compares usernames case-insensitively, so duplicates are checked the same way.
+        key = result['username'].casefold()
+        if error is None and key in seen:
+            error = f'username {result["username"]} appears more than once in the import'
+        seen.add(key)
+        if error:
+            result.update(status='error', error=error)
+        else:
+            valid.append((result, row))
+
+    taken = set()
+    for chunk in _chunks([result['username'] for result, _ in valid], chunk_size):
+        taken.update(username.casefold() for username in
+                     Resident.objects.filter(username__in=chunk).values_list('username', flat=True))
+    accepted = []
+    for result, row in valid:
+        if result['username'].casefold() in taken:
+            result.update(status='error', error=f'username {result["username"]} already exists')
+        else:
+            accepted.append((result, row))
+
+    # PBKDF2 dominates the cost of creating an account, so hashing runs on every core before any insert.
+    plain = [(result, _text(row, 'password')) for result, row in accepted if not _text(row, 'password_hash')]
+    hashes = dict(zip((id(result) for result, _ in plain), hash_passwords([p for _, p in plain], processes)))
+
+    created = 0
+    with transaction.atomic():
+        for chunk in _chunks(accepted, chunk_size):
+            residents = [
+                Resident(**{name: _text(row, name) or (None if name == 'phone' else '') for name in RESIDENT_FIELDS},
+                         password=hashes.get(id(result)) or _text(row, 'password_hash'))
+                for result, row in chunk
+            ]
+            Resident.objects.bulk_create(residents, batch_size=chunk_size)
+            # MySQL cannot return primary keys from a bulk insert, so the ids are looked up by username.
+            ids = dict(Resident.objects.filter(username__in=[r.username for r in residents])
+                       .values_list('username', 'id'))
+            members = []
+            for result, row in chunk:
+                result.update(status='created', id=ids[result['username']])
+                members.extend(FaMember(resident_id=result['id'], name=_text(member, 'name'),
+                                        numberXe=_text(member, 'numberXe'))
+                               for member in parse_family_members(row.get('family_members')))
+            FaMember.objects.bulk_create(members, batch_size=chunk_size)
+            created += len(chunk)
+            if progress:
+                progress(created, len(accepted))
+
+    if created:
+        # bulk_create skips post_save, so the resident counts on the dashboard are refreshed here.
+        invalidate_dashboard()
+    return {'created': created, 'failed': len(results) - created, 'results': results}
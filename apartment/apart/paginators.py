@@ -1,5 +1,31 @@
 from rest_framework import pagination
 
+
+class CursorPaginator(pagination.CursorPagination):
+    page_size = 12
+    max_page_size = 12
+    ordering = '-id'
+
+
 class Paginator(pagination.PageNumberPagination):
     page_size = 12
-    max_page_size = 12
\ No newline at end of file
+    max_page_size = 12
+    cursor_paginator_class = CursorPaginator
+
+    # Clients opt into keyset paging with ?pagination=cursor; the returned next/previous
+    # links carry ?cursor=..., which keeps them in that mode.
+    def use_cursor(self, request):
+        return request.query_params.get('pagination') == 'cursor' or 'cursor' in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            # Every paginated list is ordered by -id, which is the cursor ordering.
+            self.cursor_paginator = self.cursor_paginator_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Item, Resident
+
+PARCEL_BULK_LIMIT = getattr(settings, 'PARCEL_BULK_LIMIT', 1000)
+
+
+def _resident_key(row):
+    if row.get('resident') not in (None, ''):
+        try:
+            return 'id', int(row['resident'])
+        except (TypeError, ValueError):
+            return None
+    if row.get('username'):
+        return 'username', str(row['username'])
+    return None
+
+
+def bulk_create_parcels(rows):
+    keys = [_resident_key(row) if isinstance(row, dict) else None for row in rows]
+    ids = {key[1] for key in keys if key and key[0] == 'id'}
+    usernames = {key[1] for key in keys if key and key[0] == 'username'}
+
+    found = {}
+    if ids or usernames:
+        residents = Resident.objects.filter(Q(id__in=ids) | Q(username__in=usernames)).values_list('id', 'username')
+        for resident_id, username in residents:
+            found[('id', resident_id)] = resident_id
+            found[('username', username)] = resident_id
+
+    results = []
+    items = []
+    for index, (row, key) in enumerate(zip(rows, keys)):
+        name = str(row.get('name') or '').strip() if isinstance(row, dict) else ''
+        if key is None:
+            results.append({'index': index, 'status': 'error', 'error': 'resident or username is required'})
+        elif key not in found:
+            results.append({'index': index, 'status': 'error', 'error': f'Resident {key[1]} not found'})
+        elif not name or len(name) > Item._meta.get_field('name').max_length:
+            results.append({'index': index, 'status': 'error', 'error': 'name is required (max 100 characters)'})
+        else:
+            item = Item(resident_id=found[key], name=name)
+            items.append(item)
+            results.append({'index': index, 'status': 'created', 'resident_id': found[key], 'item': item})
+
+    if len(items) < len(rows):
+        # All or nothing, so the caller can fix the bad rows and resend the batch without creating duplicates.
+        for result in results:
+            if result.pop('item', None) is not None:
+                result['status'] = 'skipped'
+        return results
+
+    Item.objects.bulk_create(items)
+    for result in results:
+        item = result.pop('item', None)
+        if item is not None:
+            # MySQL cannot return primary keys from a bulk insert; the id is then null.
+            result['id'] = item.pk
+    return results
+
+
+def bulk_mark_received(queryset, ids):
+    with transaction.atomic():
+        # Locked so the statuses read here are the ones the update changes: two overlapping requests cannot
+        # both report the same parcel as received.
+        statuses = dict(queryset.select_for_update().filter(id__in=ids).values_list('id', 'status'))
+        pending = [item_id for item_id, item_status in statuses.items() if item_status == 'PENDING']
+        received = Item.objects.filter(id__in=pending, status='PENDING').update(status='RECEIVED') if pending else 0
+
+    results = []
+    for item_id in dict.fromkeys(ids):
+        if item_id not in statuses:
+            results.append({'id': item_id, 'status': 'not_found'})
+        elif statuses[item_id] == 'PENDING':
+            results.append({'id': item_id, 'status': 'received'})
+        else:
+            results.append({'id': item_id, 'status': 'already_received'})
+    return received, results
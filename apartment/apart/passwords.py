@@ -0,0 +1,54 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import identify_hasher, make_password
+
+PASSWORD_HASH_PROCESSES = getattr(settings, 'PASSWORD_HASH_PROCESSES', None) or os.cpu_count() or 1
+# Below this many passwords, handing them to worker processes costs more than it saves.
+PASSWORD_HASH_POOL_MIN = getattr(settings, 'PASSWORD_HASH_POOL_MIN', 32)
+
+
+def is_password_hash(value):
+    try:
+        identify_hasher(value)
+    except ValueError:
+        return False
+    return True
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _new_pool(processes):
+    # spawn, not fork: the parent may be a threaded server holding DB connections and locks.
+    # Children import only this module and Django's hashers, never the models.
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _new_pool(PASSWORD_HASH_PROCESSES)
+        return _pool
+
+
+def _map(pool, passwords, processes):
+    return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (processes * 4))))
+
+
+def hash_passwords(passwords, processes=None):
+    # processes=None shares one long-lived pool per server process; an explicit count (the import command)
+    # gets a pool of that size for this call only.
+    passwords = list(passwords)
+    workers = min(processes or PASSWORD_HASH_PROCESSES, len(passwords))
+    if workers <= 1 or len(passwords) < PASSWORD_HASH_POOL_MIN:
+        return [make_password(password) for password in passwords]
+    if processes is None:
+        return _map(_get_pool(), passwords, workers)
+    with _new_pool(workers) as pool:
+        return _map(pool, passwords, workers)
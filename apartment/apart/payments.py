@@ -0,0 +1,65 @@
+import logging
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+
+from .gateways import GatewayError
+from .models import Bill
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentError(GatewayError):
+    pass
+
+
+class BillNotPayable(PaymentError):
+    pass
+
+
+class PaymentMismatch(PaymentError):
+    pass
+
+
+def _payable_bill(bill_id, resident):
+    bill = Bill.objects.filter(id=bill_id, resident=resident).only('id', 'amount', 'payment_status').first()
+    if bill is None:
+        raise BillNotPayable('Bill not found')
+    if bill.payment_status == 'PAID':
+        raise BillNotPayable('Bill is already paid')
+    return bill
+
+
+async def create_bill_payment(bill_id, resident, gateway):
+    bill = await sync_to_async(_payable_bill)(bill_id, resident)
+    return await gateway.acreate_payment(int(bill.amount), f'{gateway.provider.description} - bill {bill.id}',
+                                        metadata={'bill_id': bill.id})
+
+
+def mark_bill_paid(bill_id, amount):
+    with transaction.atomic():
+        bill = Bill.objects.select_for_update().filter(id=bill_id).first()
+        if bill is None:
+            raise PaymentMismatch(f'Unknown bill {bill_id}')
+        if Decimal(amount) != bill.amount:
+            raise PaymentMismatch(f'Amount {amount} does not match bill {bill_id}')
+        if bill.payment_status == 'PAID':
+            return bill, False
+        bill.payment_status = 'PAID'
+        # save() rather than update() so the post_save rollup and dashboard hooks run.
+        bill.save(update_fields=['payment_status'])
+    return bill, True
+
+
+async def handle_callback(provider, payload):
+    result = provider.parse_callback(payload)
+    bill_id = result['metadata'].get('bill_id')
+    if not result['paid'] or bill_id is None:
+        logger.info('%s callback for order %s ignored (paid=%s, bill=%s)',
+                    provider.name, result['order_id'], result['paid'], bill_id)
+        return result, False
+    _, changed = await sync_to_async(mark_bill_paid)(bill_id, result['amount'])
+    logger.info('%s callback for order %s: bill %s %s', provider.name, result['order_id'], bill_id,
+                'marked PAID' if changed else 'was already PAID')
+    return result, changed
@@ -0,0 +1,71 @@
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+
+from .billing import BILLING_CHUNK_SIZE, create_period_bills, parse_period, period_bounds
+from .dashboard import invalidate_dashboard
+from .models import Bill, MeterReading
+
+# Tier widths in units (None = unbounded last tier) and VND unit prices.
+DEFAULT_UTILITY_TARIFFS = {
+    'E': {
+        'bill_type': 'Tiền điện',
+        'tiers': [(50, 1806), (50, 1866), (100, 2167), (100, 2729), (100, 3050), (None, 3151)],
+    },
+    'W': {
+        'bill_type': 'Tiền nước',
+        'tiers': [(10, 5973), (10, 7052), (10, 8669), (None, 15929)],
+    },
+}
+UTILITY_TARIFFS = getattr(settings, 'UTILITY_TARIFFS', DEFAULT_UTILITY_TARIFFS)
+
+
+def tiered_charges(usage, tiers):
+    usage = np.asarray(usage, dtype=np.float64)
+    widths = np.array([np.inf if width is None else width for width, _ in tiers], dtype=np.float64)
+    prices = np.array([price for _, price in tiers], dtype=np.float64)
+    lower = np.concatenate(([0.0], np.cumsum(widths)[:-1]))
+    # units[i, t] = how much of meter i's usage falls inside tier t.
+    units = np.clip(usage[:, None] - lower[None, :], 0, widths[None, :])
+    return units @ prices
+
+
+def load_readings(period, kind):
+    rows = (MeterReading.objects.filter(period=period, kind=kind)
+            .values_list('resident_id', 'previous', 'current').iterator(chunk_size=BILLING_CHUNK_SIZE))
+    return np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(-1, 3)
+
+
+def price_readings(readings, tiers):
+    charges = np.rint(tiered_charges(readings[:, 2] - readings[:, 1], tiers))
+    # A resident with several flats gets one bill per utility covering all of their meters.
+    resident_ids, index = np.unique(readings[:, 0], return_inverse=True)
+    return resident_ids, np.bincount(index, weights=charges, minlength=len(resident_ids))
+
+
+def bill_meter_readings(period, kinds=None):
+    period = parse_period(period)
+    issue_date, due_date = period_bounds(period)
+    result = {'period': period, 'meters': 0, 'created': 0, 'skipped': 0}
+
+    for kind in kinds or UTILITY_TARIFFS:
+        tariff = UTILITY_TARIFFS[kind]
+        readings = load_readings(period, kind)
+        if not len(readings):
+            continue
+        resident_ids, amounts = price_readings(readings, tariff['tiers'])
+        bills = [
+            Bill(resident_id=int(resident_id), bill_type=tariff['bill_type'], amount=int(amount),
+                 issue_date=issue_date, due_date=due_date, period=period)
+            for resident_id, amount in zip(resident_ids.tolist(), amounts.tolist())
+        ]
+        for start in range(0, len(bills), BILLING_CHUNK_SIZE):
+            chunk = bills[start:start + BILLING_CHUNK_SIZE]
+            created = create_period_bills(period, chunk)
+            result['created'] += created
+            result['skipped'] += len(chunk) - created
+        result['meters'] += len(readings)
+
+    invalidate_dashboard()
+    return result
@@ -0,0 +1,62 @@
+import json
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+def _mysql_problems(plan):
+    problems = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            if node.get('access_type') == 'ALL':
+                problems.append(f"full scan of {node.get('table_name')}")
+            if node.get('using_filesort'):
+                problems.append('filesort')
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(json.loads(plan))
+    return problems
+
+
+def _sqlite_problems(plan):
+    problems = []
+    for line in plan.splitlines():
+        # A filtered query should SEARCH; SCAN walks the whole table or index, even "USING INDEX".
+        if line.startswith('SCAN '):
+            problems.append('full scan: ' + line)
+        if 'USE TEMP B-TREE' in line:
+            problems.append('filesort: ' + line)
+    return problems
+
+
+def explain(sql, using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN FORMAT=JSON ' + sql)
+            plan = cursor.fetchone()[0]
+            return plan, _mysql_problems(plan)
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        plan = '\n'.join(row[-1] for row in cursor.fetchall())
+        return plan, _sqlite_problems(plan)
+
+
+@contextmanager
+def capture_plans(table, using=DEFAULT_DB_ALIAS):
+    # EXPLAINs the filtered SELECTs on table that the block actually ran, e.g. a request through the test client.
+    connection = connections[using]
+    source = f'FROM {connection.ops.quote_name(table)}'
+    plans = []
+    with CaptureQueriesContext(connection) as queries:
+        yield plans
+    for query in queries.captured_queries:
+        sql = query['sql']
+        if sql.startswith('SELECT') and source in sql and ' WHERE ' in sql:
+            plan, problems = explain(sql, using)
+            plans.append({'sql': sql, 'plan': plan, 'problems': problems})
@@ -0,0 +1,205 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .caches import is_shared
+
+logger = logging.getLogger(__name__)
+
+REPLICA_DATABASES = getattr(settings, 'REPLICA_DATABASES', [])
+REPLICA_STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+REPLICA_RETRY_INTERVAL = getattr(settings, 'REPLICA_RETRY_INTERVAL', 30)
+
+UNSAFE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+PIN_SESSION_KEY = '_replica_pinned_until'
+
+_use_replica = ContextVar('use_replica', default=False)
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+class ReplicaHealth:
+    def __init__(self):
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    def available(self, alias):
+        with self._lock:
+            return self._down_until.get(alias, 0) <= time.monotonic()
+
+    def check(self, alias):
+        if not self.available(alias):
+            return False
+        try:
+            # Only opens a connection when this thread has none; open connections are trusted until a check fails.
+            connections[alias].ensure_connection()
+        except Exception as e:
+            self.mark_down(alias, e)
+            return False
+        return True
+
+    def mark_down(self, alias, error=None):
+        with self._lock:
+            self._down_until[alias] = time.monotonic() + REPLICA_RETRY_INTERVAL
+        logger.warning('Replica %s unavailable, reading from primary for %ss: %s', alias, REPLICA_RETRY_INTERVAL,
+                       error)
+
+
+health = ReplicaHealth()
+
+
+def _pin_key(user_id):
+    return f'replica:pin:{user_id}'
+
+
+def _user(request):
+    user = getattr(request, 'user', None)
+    return user if user is not None and user.is_authenticated else None
+
+
+def pin_to_primary(request):
+    user = _user(request)
+    if user is None:
+        return
+    if is_shared():
+        cache.set(_pin_key(user.pk), True, REPLICA_STICKY_SECONDS)
+    elif hasattr(request, 'session'):
+        # A per-process cache would only pin the worker that took the write, so the pin travels with the session.
+        request.session[PIN_SESSION_KEY] = time.time() + REPLICA_STICKY_SECONDS
+
+
+def is_pinned(request):
+    user = _user(request)
+    if user is None:
+        return False
+    if is_shared():
+        return bool(cache.get(_pin_key(user.pk)))
+    session = getattr(request, 'session', None)
+    if session is None:
+        return False
+    # The session row is loaded from the primary; a lagging replica may not have the pin the last request saved.
+    token = _use_replica.set(False)
+    try:
+        return session.get(PIN_SESSION_KEY, 0) > time.time()
+    finally:
+        _use_replica.reset(token)
+
+
+def _pinned(state):
+    if state is None:
+        return False
+    if state['wrote']:
+        return True
+    if state['pinned'] is None:
+        # Resolved on the first replica read, after DRF has authenticated request.user.
+        state['pinned'] = False
+        state['pinned'] = is_pinned(state['request'])
+    return state['pinned']
+
+
+def _healthy_replica():
+    candidates = [alias for alias in REPLICA_DATABASES if health.available(alias)]
+    random.shuffle(candidates)
+    for alias in candidates:
+        if health.check(alias):
+            return alias
+    return None
+
+
+def choose_replica():
+    state = _request_state.get()
+    if not _use_replica.get() or _pinned(state):
+        return None
+    if state is None:
+        return _healthy_replica()
+    # One replica per request, so a count and the page it paginates come from the same snapshot.
+    if 'replica' not in state:
+        state['replica'] = _healthy_replica()
+    return state['replica']
+
+
+@contextmanager
+def replica():
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def use_replica(view):
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            with replica():
+                return await view(*args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            with replica():
+                return view(*args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return choose_replica()
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary, so objects loaded from either may be related.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db not in REPLICA_DATABASES
+
+
+class ReplicaStickinessMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _request_state.set(self.start(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        self.finish(request)
+        return response
+
+    async def __acall__(self, request):
+        token = _request_state.set(self.start(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        await sync_to_async(self.finish)(request)
+        return response
+
+    def start(self, request):
+        return {'request': request, 'wrote': False, 'pinned': None}
+
+    def finish(self, request):
+        # Read-your-writes: the user's replica reads go to the primary until replication has caught up.
+        if REPLICA_DATABASES and request.method in UNSAFE_METHODS:
+            pin_to_primary(request)
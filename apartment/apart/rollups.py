@@ -0,0 +1,140 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+
+from .models import Bill, BillRollup
+
+ROLLUP_FIELDS = ['paid_count', 'unpaid_count', 'paid_amount', 'unpaid_amount']
+
+
+def bill_state(bill):
+    return bill.resident_id, bill.payment_status, bill.amount
+
+
+def _rollups(resident_id):
+    if resident_id is None:
+        return BillRollup.objects.filter(resident__isnull=True)
+    return BillRollup.objects.filter(resident_id=resident_id)
+
+
+def lock_global_rollup():
+    # Writers update the global row first, so holding its lock keeps them out until we commit. Take it before
+    # reading any bills: under REPEATABLE READ the snapshot starts at the transaction's first plain read.
+    if not list(_rollups(None).select_for_update()):
+        BillRollup.objects.get_or_create(resident=None)
+        list(_rollups(None).select_for_update())
+
+
+def _update_rollup(resident_id, changes, create):
+    rows = _rollups(resident_id)
+    if not rows.update(**changes) and create:
+        BillRollup.objects.get_or_create(resident_id=resident_id)
+        rows.update(**changes)
+
+
+def _changes(payment_status, count, amount):
+    prefix = 'paid' if payment_status == 'PAID' else 'unpaid'
+    return {
+        f'{prefix}_count': F(f'{prefix}_count') + count,
+        f'{prefix}_amount': F(f'{prefix}_amount') + Decimal(amount),
+    }
+
+
+def apply_bill_delta(state, sign):
+    resident_id, payment_status, amount = state
+    changes = _changes(payment_status, sign, sign * Decimal(amount))
+    # The global row is always locked first so rebuild_bill_rollups() can serialize writers on it.
+    _update_rollup(None, changes, create=True)
+    # A removal never creates a row: the resident's rollup may be going away in the same cascade.
+    _update_rollup(resident_id, changes, create=sign > 0)
+
+
+def record_bill_saved(bill):
+    old = getattr(bill, '_rollup_state', None)
+    new = bill_state(bill)
+    if old == new:
+        return
+    if old is not None:
+        apply_bill_delta(old, -1)
+    apply_bill_delta(new, 1)
+    bill._rollup_state = new
+
+
+def record_bill_deleted(bill):
+    apply_bill_delta(getattr(bill, '_rollup_state', None) or bill_state(bill), -1)
+
+
+def record_bills_created(bills):
+    # bulk_create() skips signals: bump the global row by the batch totals, then recompute the
+    # touched residents from Bill and upsert their rows, which is one aggregate plus one write per batch.
+    totals = defaultdict(lambda: [0, Decimal(0)])
+    for bill in bills:
+        totals[bill.payment_status][0] += 1
+        totals[bill.payment_status][1] += Decimal(bill.amount)
+    for payment_status, (count, amount) in totals.items():
+        _update_rollup(None, _changes(payment_status, count, amount), create=True)
+    refresh_resident_rollups({bill.resident_id for bill in bills})
+
+
+def refresh_resident_rollups(resident_ids):
+    if not resident_ids:
+        return
+    with transaction.atomic():
+        # Recomputed rows overwrite the stored ones, so no writer may change these residents' bills in between.
+        lock_global_rollup()
+        live = compute_live_rollups(Bill.objects.filter(resident_id__in=resident_ids))
+        unique_fields = ['resident'] if connection.features.supports_update_conflicts_with_target else None
+        BillRollup.objects.bulk_create(
+            [BillRollup(resident_id=resident_id, **live[resident_id]) for resident_id in resident_ids],
+            update_conflicts=True, unique_fields=unique_fields, update_fields=ROLLUP_FIELDS, batch_size=1000,
+        )
+
+
+def get_bill_rollup(resident=None):
+    rollup = _rollups(resident.id if resident else None).first()
+    return rollup or BillRollup(resident=resident)
+
+
+def compute_live_rollups(bills=None):
+    live = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+    bills = Bill.objects.all() if bills is None else bills
+    rows = bills.values('resident_id', 'payment_status').annotate(n=Count('id'), total=Sum('amount'))
+    for row in rows:
+        prefix = 'paid' if row['payment_status'] == 'PAID' else 'unpaid'
+        for resident_id in (row['resident_id'], None):
+            live[resident_id][f'{prefix}_count'] += row['n']
+            live[resident_id][f'{prefix}_amount'] += row['total'] or 0
+    live.setdefault(None, dict.fromkeys(ROLLUP_FIELDS, 0))
+    return live
+
+
+def stored_rollups():
+    return {row.pop('resident_id'): row for row in BillRollup.objects.values('resident_id', *ROLLUP_FIELDS)}
+
+
+def diff_bill_rollups():
+    live = compute_live_rollups()
+    stored = stored_rollups()
+    empty = dict.fromkeys(ROLLUP_FIELDS, 0)
+    mismatches = []
+    for resident_id in set(live) | set(stored):
+        expected = live.get(resident_id, empty)
+        actual = stored.get(resident_id, empty)
+        if any(expected[f] != actual[f] for f in ROLLUP_FIELDS):
+            mismatches.append({'resident_id': resident_id, 'expected': expected, 'actual': actual})
+    return mismatches
+
+
+def rebuild_bill_rollups():
+    with transaction.atomic():
+        lock_global_rollup()
+        live = compute_live_rollups()
+        _rollups(None).update(**live.pop(None))
+        BillRollup.objects.filter(resident__isnull=False).delete()
+        BillRollup.objects.bulk_create(
+            [BillRollup(resident_id=resident_id, **values) for resident_id, values in live.items()],
+            batch_size=1000,
+        )
+    return len(live) + 1
@@ -2,62 +2,74 @@ from django.contrib.auth.hashers import make_password
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 from rest_framework.serializers import ModelSerializer
+from .media import media_status, media_url, thumbnail_url
 from .models import Resident, Flat, Bill, Item, Feedback, Survey, FaMember, SurveyResult, Product, Cart, \
     CartProduct, OrderProduct, Order
+from .parcels import PARCEL_BULK_LIMIT
+from .uploads import stage_upload
 
 
-class ResidentSerializer(serializers.ModelSerializer):
+class DeferredUploadMixin:
+    upload_fields = ()
+
+    def save(self, **kwargs):
+        # Image files are spooled and uploaded by apart.uploads after the response, not in pre_save.
+        uploads = {name: self.validated_data.pop(name) for name in self.upload_fields if self.validated_data.get(name)}
+        instance = super().save(**kwargs)
+        for name, file in uploads.items():
+            stage_upload(instance, name, file)
+        return instance
+
+
+def thumbnail_size(context):
+    view = context.get('view')
+    return 'detail' if getattr(view, 'action', None) == 'retrieve' else 'list'
+
+
+class ResidentSerializer(DeferredUploadMixin, serializers.ModelSerializer):
+    upload_fields = ['avatar']
     avatar_url = serializers.SerializerMethodField()
+    avatar_status = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
     avatar = serializers.ImageField(write_only=True, required=False)
     is_staff = serializers.BooleanField(required=False, default=False)
     is_superuser = serializers.BooleanField(required=False, default=False)
     password = serializers.CharField(write_only=True, required=True, style={'input_type': 'password'})
 
     def get_avatar_url(self, instance):
-        if instance.avatar:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(instance.avatar.url)
-            return instance.avatar.url
-        return None
-
-    def to_representation(self, instance):
-        rep = super().to_representation(instance)
-        rep['avatar_url'] = self.get_avatar_url(instance)
-        return rep
+        return media_url(instance.avatar, self.context.get('request'))
+
+    def get_avatar_status(self, instance):
+        return media_status(instance.avatar)
+
+    def get_thumbnail_url(self, instance):
+        return thumbnail_url(instance.avatar, self.context.get('request'), thumbnail_size(self.context))
 
     def create(self, validated_data):
-        avatar = validated_data.pop('avatar', None)
         resident = Resident(**validated_data)
         resident.set_password(validated_data['password'])
-        if avatar:
-            resident.avatar = avatar
         resident.save()
         return resident
 
     class Meta:
         model = Resident
         fields = ['id', 'first_name', 'last_name', 'email', 'phone', 'username', 'password', 'avatar', 'avatar_url',
-                  'is_staff', 'is_superuser']
+                  'avatar_status', 'thumbnail_url', 'is_staff', 'is_superuser']
         extra_kwargs = {
             'password': {'write_only': True},
             'is_active': {'read_only': True}
         }
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DeferredUploadMixin, serializers.ModelSerializer):
+    upload_fields = ['image']
     image_url = serializers.SerializerMethodField()
+    image_status = serializers.SerializerMethodField()
     image = serializers.ImageField(write_only=True, required=False)
     def get_image_url(self, instance):
-        if instance.image:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(instance.image.url)
-            return instance.image.url
-        return None
-
-    def to_representation(self, instance):
-        rep = super().to_representation(instance)
-        rep['image_url'] = self.get_image_url(instance)
-        return rep
+        return media_url(instance.image, self.context.get('request'))
+
+    def get_image_status(self, instance):
+        return media_status(instance.image)
+
     class Meta:
         model = Product
         fields = '__all__'
@@ -108,35 +120,34 @@ class ItemSerializer(ModelSerializer):
         model = Item
         fields = '__all__'
 
-class BillSerializer(serializers.ModelSerializer):
+class BulkMarkReceivedSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=PARCEL_BULK_LIMIT)
+
+class BillSerializer(DeferredUploadMixin, serializers.ModelSerializer):
+    upload_fields = ['image']
     first_name = serializers.CharField(source='resident.first_name', read_only=True)
     last_name = serializers.CharField(source='resident.last_name', read_only=True)
     phone = serializers.CharField(source='resident.phone', read_only=True)
     #resident_id = serializers.PrimaryKeyRelatedField(queryset=Resident.objects.all(), write_only=True, source='resident')
     image_url = serializers.SerializerMethodField()
+    image_status = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
     image = serializers.ImageField(write_only=True, required=False)
     avatar_url = serializers.SerializerMethodField()
+    period = serializers.RegexField(r'^\d{4}-(0[1-9]|1[0-2])$', required=False, allow_null=True, default=None)
 
     def get_image_url(self, instance):
-        if instance.image:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(instance.image.url)
-            return instance.image.url
-        return None
+        return media_url(instance.image, self.context.get('request'))
+
+    def get_image_status(self, instance):
+        return media_status(instance.image)
+
+    def get_thumbnail_url(self, instance):
+        return thumbnail_url(instance.image, self.context.get('request'), thumbnail_size(self.context))
+
     def get_avatar_url(self, instance):
-        if instance.resident.avatar:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(instance.resident.avatar.url)
-            return instance.resident.avatar.url
-        return None
-
-    def to_representation(self, instance):
-        rep = super().to_representation(instance)
-        rep['image_url'] = self.get_image_url(instance)
-        rep['avatar_url'] = self.get_avatar_url(instance)
-        return rep
+        return media_url(instance.resident.avatar, self.context.get('request'))
+
     class Meta:
         model = Bill
         fields = '__all__'
@@ -0,0 +1,122 @@
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from oauth2_provider.models import AccessToken
+
+from .analytics import invalidate_survey_statistics
+from .authentication import invalidate_credential, invalidate_user
+from .carts import schedule_cart_totals_invalidation
+from .catalog import schedule_catalog_bump
+from .dashboard import invalidate_dashboard
+from .dbpool.pool import record_connection_opened, record_connections_reused
+from .locks import lock_state_changed, record_resident_saved, register_session, unregister_session
+from .models import Bill, CartProduct, Flat, Product, Resident, SurveyResult
+from .rollups import record_bill_deleted, record_bill_saved
+from .uploads import release_media
+
+
+@receiver([post_save, post_delete], sender=CartProduct)
+def cart_product_changed(sender, instance, **kwargs):
+    schedule_cart_totals_invalidation(instance.cart_id)
+
+
+@receiver(post_save, sender=Product)
+def product_price_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'price' not in update_fields):
+        return
+    cart_ids = CartProduct.objects.filter(product=instance).values_list('cart_id', flat=True)
+    schedule_cart_totals_invalidation(*set(cart_ids))
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_catalog_changed(sender, instance, **kwargs):
+    schedule_catalog_bump()
+
+
+@receiver([post_save, post_delete], sender=Resident)
+@receiver([post_save, post_delete], sender=Flat)
+@receiver([post_save, post_delete], sender=Bill)
+@receiver([post_save, post_delete], sender=SurveyResult)
+def dashboard_source_changed(sender, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_dashboard()
+
+
+@receiver(post_save, sender=Bill)
+def bill_saved(sender, instance, **kwargs):
+    record_bill_saved(instance)
+
+
+@receiver(post_delete, sender=Bill)
+def bill_deleted(sender, instance, **kwargs):
+    record_bill_deleted(instance)
+
+
+@receiver([post_save, post_delete], sender=SurveyResult)
+def survey_result_changed(sender, instance, **kwargs):
+    invalidate_survey_statistics(instance.survey_id)
+
+
+@receiver(post_delete, sender=Resident)
+def resident_media_deleted(sender, instance, **kwargs):
+    release_media(instance.avatar)
+
+
+@receiver(post_delete, sender=Bill)
+@receiver(post_delete, sender=Product)
+def image_media_deleted(sender, instance, **kwargs):
+    release_media(instance.image)
+
+
+@receiver([post_save, post_delete], sender=Resident)
+def resident_auth_changed(sender, instance, update_fields=None, **kwargs):
+    # Covers lock_account (is_active), change_password and profile edits; cached snapshots are full rows.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=AccessToken)
+def access_token_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        invalidate_credential('oauth2', instance.token)
+
+
+@receiver(post_save, sender=Resident)
+def resident_lock_changed(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'is_active' not in update_fields:
+        return
+    record_resident_saved(instance, created)
+
+
+@receiver(post_delete, sender=Resident)
+def resident_lock_deleted(sender, instance, **kwargs):
+    if not instance.is_active:
+        lock_state_changed(instance.pk, False)
+
+
+@receiver(user_logged_in)
+def session_started(sender, request, user, **kwargs):
+    if hasattr(request, 'session'):
+        register_session(user, request.session.session_key)
+
+
+@receiver(user_logged_out)
+def session_ended(sender, request, user, **kwargs):
+    if hasattr(request, 'session'):
+        unregister_session(request.session.session_key)
+
+
+@receiver(connection_created)
+def database_connection_opened(sender, connection, **kwargs):
+    record_connection_opened(connection)
+
+
+@receiver(request_started)
+def database_connections_reused(sender, **kwargs):
+    # Runs after Django's close_old_connections, so whatever is still open here is carried into this request.
+    record_connections_reused(connections)
@@ -0,0 +1,119 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from .gateways import MomoProvider, ZaloPayProvider, sign
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+        with server.lock:
+            server.requests.append((self.path, body))
+            fail = server.fail_next > 0
+            if fail:
+                server.fail_next -= 1
+
+        if server.delay:
+            time.sleep(server.delay)
+        if fail:
+            return self.reply(503, {'message': 'Stub gateway failure'})
+
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            data = json.loads(body or '{}')
+            order_id = data.get('orderId')
+            return self.reply(200, {
+                'partnerCode': data.get('partnerCode'),
+                'orderId': order_id,
+                'requestId': data.get('requestId'),
+                'amount': data.get('amount'),
+                'resultCode': 0,
+                'message': 'Successful.',
+                'payUrl': f'http://{server.server_address[0]}:{server.server_address[1]}/pay/{order_id}',
+            })
+
+        data = {k: v[0] for k, v in parse_qs(body).items()}
+        order_id = data.get('app_trans_id')
+        self.reply(200, {
+            'return_code': 1,
+            'return_message': 'Giao dịch thành công',
+            'app_trans_id': order_id,
+            'order_url': f'http://{server.server_address[0]}:{server.server_address[1]}/pay/{order_id}',
+        })
+
+    def reply(self, status, payload):
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        try:
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out while the stub was simulating a slow gateway.
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class StubGatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0, fail_next=0, verbose=False):
+        super().__init__((host, port), StubGatewayHandler)
+        self.delay = delay
+        self.fail_next = fail_next
+        self.verbose = verbose
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def build_callback(provider, request_body, paid=True, transaction_id=None):
+    # Signed IPN body the real gateway would send back for a create request recorded by the stub.
+    transaction_id = transaction_id or int(time.time() * 1000)
+    if isinstance(provider, MomoProvider):
+        data = json.loads(request_body)
+        payload = {
+            'partnerCode': data['partnerCode'], 'orderId': data['orderId'], 'requestId': data['requestId'],
+            'amount': data['amount'], 'orderInfo': data['orderInfo'], 'orderType': 'momo_wallet',
+            'transId': transaction_id, 'resultCode': 0 if paid else 1006,
+            'message': 'Successful.' if paid else 'Transaction denied by user.', 'payType': 'napas',
+            'responseTime': int(time.time() * 1000), 'extraData': data['extraData'],
+        }
+        payload['signature'] = provider.callback_signature(payload)
+        return payload
+    if isinstance(provider, ZaloPayProvider):
+        order = {k: v[0] for k, v in parse_qs(request_body).items()}
+        data = json.dumps({
+            'app_id': int(order['app_id']), 'app_trans_id': order['app_trans_id'], 'app_time': int(order['app_time']),
+            'app_user': order['app_user'], 'amount': int(order['amount']), 'embed_data': order['embed_data'],
+            'item': order['item'], 'zp_trans_id': transaction_id, 'server_time': int(time.time() * 1000),
+        })
+        return {'data': data, 'mac': sign(provider.config['key2'], data), 'type': 1}
+    raise ValueError(f'No stub callback for {provider.name}')
@@ -1,3 +1,1112 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import requests
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from PIL import Image
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+from rest_framework.test import APIClient
+
+from . import billing
+from .analytics import summarize_ratings
+from .billing import BillingConflict, parse_charges, run_billing
+from .caches import check_shared_cache, is_shared
+from .carts import add_to_cart, cart_totals
+from .checkout import CartChanged, EmptyCart, checkout_cart
+from .dashboard import get_dashboard
+from .dbpool.pool import ConnectionPool, PooledConnectionMixin, PoolTimeout
+from . import authentication, gateways, locks, passwords, replicas, views
+from .gateways import (PAYMENT_GATEWAY, AsyncGatewayClient, CircuitBreaker, GatewayClient, GatewayUnavailable,
+                       InvalidCallback, MomoProvider, PaymentProvider, ZaloPayProvider, get_request_gateway)
+from .middleware import QueryBudgetExceeded, assert_max_queries
+from .media import local_path
+from .models import (Bill, BillRollup, Cart, CartProduct, FaMember, Feedback, Flat, Item, MediaAsset, MeterReading,
+                     Order, OrderProduct, Product, Resident, Survey, SurveyResult, UserSession)
+from .pricing import DEFAULT_UTILITY_TARIFFS, bill_meter_readings, tiered_charges
+from .queryplans import capture_plans
+from .rollups import diff_bill_rollups, get_bill_rollup, refresh_resident_rollups
+from .stub_gateway import StubGatewayServer, build_callback
+from .uploads import FileSystemBackend, process_upload, stage_upload
+
+
+LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_resident(username, **extra):
+    return Resident.objects.create_user(username, f'{username}@example.com', 'pw', phone='0900000000', **extra)
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = make_resident('admin', is_superuser=True, is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def add_rows(self, count):
+        start = Resident.objects.count()
+        for n in range(start, start + count):
+            resident = make_resident(f'resident{n}')
+            product = Product.objects.create(name=f'product{n}', price=1000, stock=10)
+            order = Order.objects.create(resident=resident, total_amount=1000)
+            OrderProduct.objects.create(order=order, product=product, quantity=1, price=1000)
+            Bill.objects.create(resident=resident, amount=1000, issue_date=date(2024, 1, 1),
+                                due_date=date(2024, 1, 31), bill_type='Điện', period='2024-01')
+            Item.objects.create(resident=resident, name=f'parcel{n}')
+            cart, _ = Cart.objects.get_or_create(resident=self.admin)
+            CartProduct.objects.create(cart=cart, product=product, quantity=2)
+
+    def measure(self, url_name, path):
+        cache.clear()
+        with assert_max_queries(settings.QUERY_BUDGETS[url_name]) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-DB-Query-Count'], str(queries.count))
+        self.assertNotIn('X-DB-N-Plus-One', response)
+        return queries.count
+
+    def assert_flat(self, url_name, path):
+        self.add_rows(2)
+        small = self.measure(url_name, path)
+        self.add_rows(8)
+        self.assertEqual(self.measure(url_name, path), small, f'{url_name} grows with the page size')
+
+    def test_bill_list(self):
+        self.assert_flat('bill-list', '/bills/')
+
+    def test_order_list(self):
+        self.assert_flat('order-list', '/order/')
+
+    def test_resident_list(self):
+        self.assert_flat('resident-list', '/residents/')
+
+    def test_product_list(self):
+        self.assert_flat('product-list', '/product/')
+
+    def test_item_list(self):
+        self.assert_flat('item-list', '/items/')
+
+    def test_cart_summary(self):
+        self.assert_flat('cart-cart-summary', '/cart/cart-summary/')
+
+    async def test_async_requests_are_counted(self):
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get('/bills/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(int(response['X-DB-Query-Count']), 0)
+
+    def test_budget_overrun_fails_the_request(self):
+        self.add_rows(2)
+        with self.settings(QUERY_BUDGETS={'bill-list': 1}):
+            client = APIClient()
+            client.force_authenticate(self.admin)
+            with self.assertRaises(QueryBudgetExceeded):
+                client.get('/bills/')
+
+
+class CartTotalsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.resident = make_resident('buyer')
+        self.cart = Cart.objects.create(resident=self.resident)
+        self.product = Product.objects.create(name='rice', price=1000, stock=10)
+
+    def test_totals_are_cached_until_the_cart_changes(self):
+        add_to_cart(self.cart, self.product, 2)
+        self.assertEqual(cart_totals(self.cart.id), {'line_count': 1, 'total_price': 2000})
+        with self.assertNumQueries(0):
+            cart_totals(self.cart.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            add_to_cart(self.cart, self.product, 1)
+        self.assertEqual(cart_totals(self.cart.id)['total_price'], 3000)
+
+    def test_checkout_invalidates_totals_after_commit(self):
+        add_to_cart(self.cart, self.product, 2)
+        cart_totals(self.cart.id)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            checkout_cart(self.resident)
+            # Still inside the transaction: dropping the entry now would let a reader re-cache the old lines.
+            self.assertEqual(cache.get(f'cart:{self.cart.id}:totals')['line_count'], 1)
+        self.assertTrue(callbacks)
+        self.assertEqual(cart_totals(self.cart.id), {'line_count': 0, 'total_price': 0})
+
+    def test_double_checkout_creates_one_order(self):
+        add_to_cart(self.cart, self.product, 2)
+        checkout_cart(self.resident)
+        with self.assertRaises(EmptyCart):
+            checkout_cart(self.resident)
+        self.assertEqual(Order.objects.filter(resident=self.resident).count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+
+    def test_checkout_rolls_back_when_a_line_disappears(self):
+        add_to_cart(self.cart, self.product, 2)
+        # A concurrent request removes the line after it was read (backends without row locks).
+        with mock.patch('apart.checkout.schedule_catalog_bump',
+                        side_effect=lambda: CartProduct.objects.filter(cart=self.cart).delete()):
+            with self.assertRaises(CartChanged):
+                checkout_cart(self.resident)
+        self.assertFalse(Order.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+
+    def test_price_change_invalidates_totals(self):
+        add_to_cart(self.cart, self.product, 2)
+        cart_totals(self.cart.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 1500
+            self.product.save()
+        self.assertEqual(cart_totals(self.cart.id)['total_price'], 3000)
+
+
+class SharedCacheTests(TestCase):
+    def test_test_cache_is_shared(self):
+        self.assertTrue(is_shared())
+        self.assertEqual(check_shared_cache(None), [])
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_local_memory_cache_is_flagged(self):
+        self.assertFalse(is_shared())
+        self.assertEqual([w.id for w in check_shared_cache(None)], ['apart.W001'])
+
+
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = make_resident('admin', is_superuser=True, is_staff=True)
+        self.resident = make_resident('resident')
+        for n in range(15):
+            for resident in (self.admin, self.resident):
+                Bill.objects.create(resident=resident, amount=1000, issue_date=date(2024, 1, 1),
+                                    due_date=date(2024, 1, 31), bill_type=f'type{n}', period='2024-01')
+                Item.objects.create(resident=resident, name=f'parcel{n}')
+                Feedback.objects.create(resident=resident, title='title', content='content')
+        self.survey = Survey.objects.create(title='survey', creator=self.admin)
+        SurveyResult.objects.create(survey=self.survey, resident=self.resident, cleanliness_rating=4,
+                                    facilities_rating=3, services_rating=5)
+
+    def assert_plans(self, user, path, table, index):
+        client = APIClient()
+        client.force_authenticate(user)
+        with capture_plans(table) as plans:
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(plans, f'{path} ran no filtered query on {table}')
+        for plan in plans:
+            self.assertEqual(plan['problems'], [], f"{path}: {plan['sql']}\n{plan['plan']}")
+            self.assertIn(index, plan['plan'], f"{path}: {plan['sql']}")
+
+    def test_bill_list(self):
+        self.assert_plans(self.admin, '/bills/?payment_status=unpaid', 'apart_bill', 'bill_status_idx')
+        self.assert_plans(self.resident, '/bills/?payment_status=unpaid', 'apart_bill', 'bill_resident_status_idx')
+        self.assert_plans(self.resident, '/bills/?payment_status=unpaid&pagination=cursor', 'apart_bill',
+                          'bill_resident_status_idx')
+
+    def test_item_list(self):
+        self.assert_plans(self.admin, '/items/?status=pending', 'apart_item', 'item_status_idx')
+        self.assert_plans(self.resident, '/items/?status=pending', 'apart_item', 'item_resident_status_idx')
+
+    def test_feedback_list(self):
+        for resolved in ('false', 'true'):
+            self.assert_plans(self.admin, f'/feedback/?resolved={resolved}', 'apart_feedback', 'feedback_resolved_idx')
+            self.assert_plans(self.resident, f'/feedback/?resolved={resolved}', 'apart_feedback',
+                              'feedback_resident_resolved_idx')
+
+    def test_survey_statistics(self):
+        self.assert_plans(self.admin, f'/statistics/{self.survey.id}/', 'apart_surveyresult',
+                          'COVERING INDEX surveyresult_ratings_idx')
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.admin = make_resident('admin', is_superuser=True, is_staff=True)
+        for n in range(5):
+            Bill.objects.create(resident=self.admin, amount=1000 + n, issue_date=date(2024, 1, 1),
+                                due_date=date(2024, 1, 31), bill_type=f'type{n}', period='2024-01')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_export_pages_by_id(self):
+        with mock.patch('apart.exports.EXPORT_CHUNK_SIZE', 2):
+            response = self.client.get('/bills/export/?type=ndjson')
+            with self.assertNumQueries(3):
+                rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], sorted(Bill.objects.values_list('id', flat=True)))
+        self.assertEqual(rows[0]['phone'], '0900000000')
+
+    def test_csv_export_has_header_and_rows(self):
+        response = self.client.get('/bills/export/')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith('\ufeffid,resident_id,first_name'))
+        self.assertEqual(len(lines), 6)
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        self.admin = make_resident('admin', is_superuser=True, is_staff=True)
+        self.flats = [Flat.objects.create(number=f'B{n}', floor=n) for n in range(15)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_cursor_pages_round_trip(self):
+        expected = [flat.id for flat in reversed(self.flats)]
+        first = self.client.get('/flats/', {'pagination': 'cursor'})
+        self.assertEqual(self.ids(first), expected[:12])
+        self.assertNotIn('count', first.data)
+        self.assertIsNone(first.data['previous'])
+        self.assertIn('cursor=', first.data['next'])
+
+        second = self.client.get(first.data['next'])
+        self.assertEqual(self.ids(second), expected[12:])
+        self.assertIsNone(second.data['next'])
+        self.assertEqual(self.ids(self.client.get(second.data['previous'])), expected[:12])
+
+    def test_page_numbers_without_the_parameter(self):
+        first = self.client.get('/flats/')
+        self.assertEqual(first.data['count'], 15)
+        self.assertIn('page=2', first.data['next'])
+        second = self.client.get('/flats/', {'page': 2})
+        self.assertEqual(self.ids(second), [flat.id for flat in reversed(self.flats[:3])])
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = [Product.objects.create(name=f'product{n}', price=1000, stock=5) for n in range(13)]
+        self.client = APIClient()
+        self.client.force_authenticate(make_resident('buyer'))
+
+    def test_unchanged_page_is_not_modified(self):
+        first = self.client.get('/product/')
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            again = self.client.get('/product/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], first['ETag'])
+
+    def test_saving_a_product_changes_the_etag(self):
+        first = self.client.get('/product/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[-1].name = 'renamed'
+            self.products[-1].save()
+        response = self.client.get('/product/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.json()['results'][0]['name'], 'renamed')
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'shop.example'])
+    def test_pages_are_cached_per_host(self):
+        self.assertTrue(self.client.get('/product/').json()['next'].startswith('http://testserver/'))
+        other = self.client.get('/product/', HTTP_HOST='shop.example', secure=True)
+        self.assertTrue(other.json()['next'].startswith('https://shop.example/'))
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = make_resident('admin', is_superuser=True, is_staff=True)
+        self.resident = make_resident('resident')
+        Flat.objects.create(number='C1', floor=1)
+        self.bill(self.resident, 'PAID')
+        self.bill(self.admin, 'UNPAID')
+        self.client = APIClient()
+
+    def bill(self, resident, payment_status, bill_type='Điện'):
+        return Bill.objects.create(resident=resident, amount=1000, issue_date=date(2024, 6, 1),
+                                   due_date=date(2024, 6, 15), bill_type=bill_type, payment_status=payment_status)
+
+    def dashboard(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get('/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_superuser_sees_every_bill(self):
+        data = self.dashboard(self.admin)
+        self.assertEqual(data['resident_statistics'], {'staff_count': 1, 'admin_count': 1})
+        self.assertEqual(data['flat_count'], 1)
+        self.assertEqual(data['total_bills'], 2)
+        self.assertEqual(data['bill_statistics'], {'paid_bills': 1, 'unpaid_bills': 1})
+
+    def test_resident_sees_their_own_bills(self):
+        data = self.dashboard(self.resident)
+        self.assertEqual(data['total_bills'], 1)
+        self.assertEqual(data['bill_statistics'], {'paid_bills': 1, 'unpaid_bills': 0})
+
+    def test_new_bill_invalidates_the_cached_dashboard(self):
+        self.assertEqual(self.dashboard(self.resident)['total_bills'], 1)
+        with self.assertNumQueries(0):
+            get_dashboard(self.resident)
+        self.bill(self.resident, 'UNPAID', bill_type='Nước')
+        data = self.dashboard(self.resident)
+        self.assertEqual(data['total_bills'], 2)
+        self.assertEqual(data['bill_statistics'], {'paid_bills': 1, 'unpaid_bills': 1})
+
+
+class RatingSummaryTests(SimpleTestCase):
+    def test_summary_of_known_ratings(self):
+        # Columns: cleanliness, facilities, services.
+        summary = summarize_ratings(np.array([[1, 5, 2], [2, 5, 2], [3, 5, 4], [4, 5, 4], [5, 5, 4]]))
+        self.assertEqual(summary['count'], 5)
+        self.assertEqual(summary['cleanliness'], {
+            'mean': 3.0, 'median': 3.0, 'std': 1.414, 'min': 1, 'max': 5,
+            'percentiles': {'p10': 1.4, 'p25': 2.0, 'p50': 3.0, 'p75': 4.0, 'p90': 4.6},
+            'histogram': {'1': 1, '2': 1, '3': 1, '4': 1, '5': 1},
+        })
+        self.assertEqual(summary['facilities']['std'], 0.0)
+        self.assertEqual(summary['facilities']['histogram'], {'1': 0, '2': 0, '3': 0, '4': 0, '5': 5})
+        services = summary['services']
+        self.assertEqual((services['mean'], services['median'], services['std']), (3.2, 4.0, 0.98))
+        self.assertEqual(services['percentiles'], {'p10': 2.0, 'p25': 2.0, 'p50': 4.0, 'p75': 4.0, 'p90': 4.0})
+        self.assertEqual(services['histogram'], {'1': 0, '2': 2, '3': 0, '4': 3, '5': 0})
+
+    def test_no_ratings(self):
+        self.assertEqual(summarize_ratings(np.empty((0, 3), dtype=np.int32)),
+                         {'count': 0, 'cleanliness': None, 'facilities': None, 'services': None})
+
+
+class BillingTests(TestCase):
+    def setUp(self):
+        self.residents = [make_resident(f'resident{n}') for n in range(3)]
+
+    def test_parse_charges_rejects_bad_amounts(self):
+        self.assertEqual(parse_charges(['Điện=150000', '', 'Nước = 80000']), {'Điện': 150000, 'Nước': 80000})
+        for line in ('Điện=abc', 'Điện=-1', 'Điện=NaN', 'Điện=Infinity', 'Điện=12345678901', 'Điện=1.5', 'Điện'):
+            with self.assertRaises(ValueError, msg=line):
+                parse_charges([line])
+
+    def test_rerun_skips_existing_bills(self):
+        charges = parse_charges(['Điện=1000', 'Nước=500'])
+        self.assertEqual(run_billing('2024-03', charges)['created'], 6)
+        self.assertEqual(run_billing('2024-03', charges), {'period': '2024-03', 'residents': 3, 'created': 0,
+                                                           'skipped': 6})
+
+    def test_concurrent_run_is_treated_as_already_billed(self):
+        insert = billing._insert_period_bills
+        calls = []
+
+        def racing_insert(period, bills):
+            calls.append(period)
+            if len(calls) == 1:
+                # The other run commits this bill between our existence check and our insert.
+                Bill.objects.create(resident=self.residents[0], bill_type='Điện', amount=1000,
+                                    issue_date=date(2024, 3, 1), due_date=date(2024, 3, 31), period=period)
+                raise IntegrityError('duplicate key')
+            return insert(period, bills)
+
+        with mock.patch('apart.billing._insert_period_bills', racing_insert):
+            result = run_billing('2024-03', parse_charges(['Điện=1000']))
+        self.assertEqual(result['created'], 2)
+        self.assertEqual(result['skipped'], 1)
+        self.assertEqual(Bill.objects.filter(period='2024-03').count(), 3)
+
+    def test_rollups_match_bills_after_a_run(self):
+        Bill.objects.create(resident=self.residents[1], bill_type='Gửi xe', amount=300, issue_date=date(2024, 3, 1),
+                            due_date=date(2024, 3, 31), period='2024-03', payment_status='PAID')
+        run_billing('2024-03', parse_charges(['Điện=1000', 'Nước=500']))
+        self.assertEqual(diff_bill_rollups(), [])
+
+    def test_refresh_locks_before_aggregating(self):
+        calls = []
+        with mock.patch('apart.rollups.lock_global_rollup', lambda: calls.append('lock')), \
+                mock.patch('apart.rollups.compute_live_rollups',
+                           side_effect=lambda bills: calls.append('aggregate') or {r.id: {} for r in self.residents}):
+            refresh_resident_rollups({self.residents[0].id})
+        self.assertEqual(calls, ['lock', 'aggregate'])
+
+    def test_persistent_conflict_is_reported(self):
+        with mock.patch('apart.billing._insert_period_bills', side_effect=IntegrityError('duplicate key')):
+            with self.assertRaises(BillingConflict):
+                run_billing('2024-03', parse_charges(['Điện=1000']))
+
+
+class MeterPricingTests(TestCase):
+    ELECTRICITY = DEFAULT_UTILITY_TARIFFS['E']['tiers']
+    WATER = DEFAULT_UTILITY_TARIFFS['W']['tiers']
+
+    def test_tier_boundaries(self):
+        charges = tiered_charges([0, 50, 51, 100], self.ELECTRICITY)
+        self.assertEqual(charges.tolist(), [0, 50 * 1806, 50 * 1806 + 1866, 50 * 1806 + 50 * 1866])
+
+    def test_usage_above_the_top_bounded_tier(self):
+        bounded = 10 * 5973 + 10 * 7052 + 10 * 8669
+        self.assertEqual(tiered_charges([30, 35], self.WATER).tolist(), [bounded, bounded + 5 * 15929])
+        self.assertEqual(tiered_charges([500], self.ELECTRICITY).tolist(),
+                         [50 * 1806 + 50 * 1866 + 100 * 2167 + 100 * 2729 + 100 * 3050 + 100 * 3151])
+
+    def test_one_bill_per_resident_and_utility(self):
+        owner, tenant = make_resident('owner'), make_resident('tenant')
+        flats = [Flat.objects.create(number=f'A{n}', floor=1) for n in range(3)]
+        for flat, resident, previous, current in ((flats[0], owner, 100, 150), (flats[1], owner, 0, 50),
+                                                  (flats[2], tenant, 20, 20)):
+            MeterReading.objects.create(flat=flat, resident=resident, period='2024-04', kind='E',
+                                        previous=previous, current=current)
+        MeterReading.objects.create(flat=flats[0], resident=owner, period='2024-04', kind='W', previous=0, current=12)
+
+        result = bill_meter_readings('2024-04')
+        self.assertEqual(result, {'period': '2024-04', 'meters': 4, 'created': 3, 'skipped': 0})
+        # Each meter is tiered on its own, so two flats at 50 units stay in the first tier.
+        amounts = dict(Bill.objects.filter(period='2024-04', bill_type='Tiền điện')
+                       .values_list('resident__username', 'amount'))
+        self.assertEqual(amounts, {'owner': 2 * 50 * 1806, 'tenant': 0})
+        self.assertEqual(Bill.objects.get(resident=owner, bill_type='Tiền nước').amount, 10 * 5973 + 2 * 7052)
+
+        self.assertEqual(bill_meter_readings('2024-04'), {'period': '2024-04', 'meters': 4, 'created': 0,
+                                                          'skipped': 3})
+        self.assertEqual(Bill.objects.filter(period='2024-04').count(), 3)
+
+
+class BillRollupTests(TestCase):
+    def setUp(self):
+        self.resident = make_resident('resident')
+        self.bill = Bill.objects.create(resident=self.resident, bill_type='Điện', amount=1000,
+                                        issue_date=date(2024, 3, 1), due_date=date(2024, 3, 31))
+
+    def assert_rollups(self, **expected):
+        self.assertEqual(diff_bill_rollups(), [])
+        rollup = get_bill_rollup()
+        self.assertEqual({name: getattr(rollup, name) for name in expected}, expected)
+
+    def test_saving_a_partially_loaded_bill(self):
+        bill = Bill.objects.only('id', 'payment_status').get(pk=self.bill.pk)
+        bill.payment_status = 'PAID'
+        bill.save()
+        self.assert_rollups(paid_count=1, unpaid_count=0, paid_amount=1000)
+
+    def test_assigning_a_deferred_field(self):
+        bill = Bill.objects.defer('amount').get(pk=self.bill.pk)
+        bill.amount = 2500
+        bill.save()
+        self.assert_rollups(unpaid_count=1, unpaid_amount=2500)
+
+    def test_only_one_global_row(self):
+        self.assertEqual(BillRollup.objects.filter(resident__isnull=True).count(), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BillRollup.objects.create(resident=None)
+        self.assert_rollups(unpaid_count=1, unpaid_amount=1000)
+
+
+class BulkMarkReceivedTests(TestCase):
+    def setUp(self):
+        self.admin = make_resident('admin', is_superuser=True, is_staff=True)
+        self.pending = Item.objects.create(resident=self.admin, name='pending')
+        self.received = Item.objects.create(resident=self.admin, name='received', status='RECEIVED')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_marks_only_pending_items(self):
+        response = self.client.post('/items/bulk-mark-received/',
+                                    {'ids': [self.pending.id, self.received.id, 999, self.pending.id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['received'], 1)
+        self.assertEqual(response.data['results'], [
+            {'id': self.pending.id, 'status': 'received'},
+            {'id': self.received.id, 'status': 'already_received'},
+            {'id': 999, 'status': 'not_found'},
+        ])
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, 'RECEIVED')
+
+    def test_malformed_bodies_are_rejected(self):
+        for body in ([1, 2], {'ids': 'abc'}, {'ids': ['x']}, {'ids': []}, {}, {'ids': list(range(1001))}):
+            response = self.client.post('/items/bulk-mark-received/', body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+
+
+class BulkCreateItemsTests(TestCase):
+    def setUp(self):
+        self.admin = make_resident('admin', is_superuser=True, is_staff=True)
+        self.resident = make_resident('resident')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def post(self, items):
+        return self.client.post('/items/bulk-create/', {'items': items}, format='json')
+
+    def test_valid_batch(self):
+        response = self.post([{'resident': self.resident.id, 'name': 'Parcel'}, {'username': 'admin', 'name': 'Mail'}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 0))
+        self.assertEqual(sorted(Item.objects.values_list('resident__username', 'name')),
+                         [('admin', 'Mail'), ('resident', 'Parcel')])
+
+    def test_one_invalid_row_creates_nothing(self):
+        response = self.post([{'resident': self.resident.id, 'name': 'Parcel'}, {'username': 'nobody', 'name': 'Mail'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([row['status'] for row in response.data['results']], ['skipped', 'error'])
+        self.assertEqual(response.data['results'][1]['error'], 'Resident nobody not found')
+        self.assertFalse(Item.objects.exists())
+
+    def test_only_superusers_may_bulk_create(self):
+        self.client.force_authenticate(self.resident)
+        response = self.post([{'resident': self.resident.id, 'name': 'Parcel'}])
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Item.objects.exists())
+
+
+class GatewayTests(SimpleTestCase):
+    options = {'backoff': 0, 'backoff_max': 0, 'retries': 2, 'deadline': 5, 'failure_threshold': 2}
+
+    def setUp(self):
+        self.server = StubGatewayServer().start()
+        self.addCleanup(self.server.stop)
+
+    def gateway(self, provider_class=MomoProvider, cls=GatewayClient, **options):
+        client = cls(provider_class(self.server.url), {**self.options, **options})
+        if cls is GatewayClient:
+            self.addCleanup(client.close)
+        return client
+
+    def test_incomplete_provider_cannot_be_created(self):
+        class HalfProvider(PaymentProvider):
+            config = {'endpoint': 'http://gateway.invalid'}
+
+            def new_order_id(self):
+                return 'order'
+
+        with self.assertRaisesRegex(TypeError, 'parse_callback'):
+            HalfProvider()
+
+    def test_creates_payments_with_both_providers(self):
+        for provider_class in (MomoProvider, ZaloPayProvider):
+            result = self.gateway(provider_class).create_payment(100000, 'Bill 1', metadata={'bill_id': 1})
+            self.assertTrue(result['pay_url'].startswith(self.server.url + '/pay/'))
+
+    def test_retries_server_errors(self):
+        self.server.fail_next = 2
+        self.gateway().create_payment(100000, 'Bill 1')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_opens_the_circuit_after_repeated_failures(self):
+        self.server.fail_next = 100
+        client = self.gateway()
+        for _ in range(2):
+            with self.assertRaises(GatewayUnavailable):
+                client.create_payment(100000, 'Bill 1')
+        sent = len(self.server.requests)
+        with self.assertRaises(GatewayUnavailable):
+            client.create_payment(100000, 'Bill 1')
+        self.assertEqual(len(self.server.requests), sent)
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+
+    def test_any_requests_error_is_retried_and_reported_as_unavailable(self):
+        client = self.gateway()
+        with mock.patch.object(client.session, 'post', side_effect=requests.exceptions.ChunkedEncodingError('cut')):
+            with self.assertRaises(GatewayUnavailable):
+                client.create_payment(100000, 'Bill 1')
+        self.assertEqual(client.breaker.failures, 1)
+
+    def test_unexpected_error_releases_the_half_open_probe(self):
+        now = [0]
+        client = self.gateway()
+        client.breaker = CircuitBreaker(1, 30, clock=lambda: now[0])
+        client.breaker.record_failure()
+        now[0] = 31
+        with mock.patch.object(client.session, 'post', side_effect=RuntimeError('bug')):
+            with self.assertRaises(RuntimeError):
+                client.create_payment(100000, 'Bill 1')
+        self.assertEqual(client.breaker.state, CircuitBreaker.HALF_OPEN)
+        client.create_payment(100000, 'Bill 1')
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_async_client(self):
+        self.server.fail_next = 1
+        client = self.gateway(cls=AsyncGatewayClient)
+
+        async def create():
+            try:
+                return await client.create_payment(100000, 'Bill 1')
+            finally:
+                await client.close()
+
+        self.assertEqual(async_to_sync(create)()['provider'], 'momo')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_async_session_is_replaced_per_loop(self):
+        client = self.gateway(cls=AsyncGatewayClient)
+        sessions = []
+
+        async def create():
+            await client.create_payment(100000, 'Bill 1')
+            sessions.append(client._session)
+
+        async_to_sync(create)()
+        async_to_sync(create)()
+        self.assertTrue(sessions[0].closed)
+        self.assertIsNot(sessions[0], sessions[1])
+        async_to_sync(client.close)()
+
+    def test_wsgi_requests_use_the_pooled_sync_client(self):
+        self.addCleanup(gateways.reset_gateways)
+        gateways.reset_gateways()
+        with mock.patch.dict(PAYMENT_GATEWAY['endpoints'], {'momo': self.server.url}):
+            self.assertIsInstance(get_request_gateway(RequestFactory().get('/')), GatewayClient)
+            response = async_to_sync(views.payment_view)(RequestFactory().post('/', headers={'amount': '100000'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['resultCode'], 0)
+        self.assertEqual(list(gateways._clients), ['momo'])
+        self.assertEqual(gateways._async_clients, {})
+
+    def test_stub_callbacks_verify(self):
+        for provider_class in (MomoProvider, ZaloPayProvider):
+            provider = provider_class(self.server.url)
+            self.gateway(provider_class).create_payment(100000, 'Bill 1', metadata={'bill_id': 7})
+            callback = build_callback(provider, self.server.requests[-1][1])
+            parsed = provider.parse_callback(callback)
+            self.assertEqual((parsed['amount'], parsed['metadata'], parsed['paid']), (100000, {'bill_id': 7}, True))
+            field = 'signature' if provider_class is MomoProvider else 'mac'
+            with self.assertRaises(InvalidCallback):
+                provider.parse_callback({**callback, field: 'forged'})
+
+
+def image_file(color='red', name='photo.jpg'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (1200, 800), color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class FlakyBackend(FileSystemBackend):
+    def __init__(self, failures):
+        self.failures = failures
+
+    def store(self, path, field, derivatives=None):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('storage unreachable')
+        return super().store(path, field, derivatives)
+
+
+class OfflineUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.product = Product.objects.create(name='rice', price=1000, stock=10)
+
+    def stored_path(self, value):
+        return os.path.join(settings.MEDIA_ROOT, local_path(value))
+
+    def test_upload_is_processed_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            upload = stage_upload(self.product, 'image', image_file())
+        upload.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(upload.status, 'DONE')
+        self.assertEqual(local_path(self.product.image), local_path(upload.public_id))
+        path = self.stored_path(self.product.image)
+        self.assertTrue(os.path.exists(path))
+        stem = os.path.splitext(path)[0]
+        self.assertTrue(os.path.exists(f'{stem}_list.jpg') and os.path.exists(f'{stem}_detail.jpg'))
+        with Image.open(path) as stored:
+            self.assertLessEqual(max(stored.size), 1200)
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, 'uploads', 'pending')), [])
+
+    def test_identical_files_share_one_asset(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            stage_upload(self.product, 'image', image_file())
+        other = Product.objects.create(name='salt', price=500, stock=5)
+        self.assertIsNone(stage_upload(other, 'image', image_file()))
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(str(other.image), str(self.product.image))
+        self.assertEqual(MediaAsset.objects.get().ref_count, 2)
+
+    def test_failed_uploads_are_retried_by_the_command(self):
+        upload = stage_upload(self.product, 'image', image_file())
+        with mock.patch('apart.uploads.UPLOAD_MAX_ATTEMPTS', 2):
+            self.assertEqual(process_upload(upload.id, FlakyBackend(failures=2)), 'FAILED')
+        upload.refresh_from_db()
+        self.assertEqual((upload.status, upload.attempts), ('FAILED', 2))
+        call_command('process_uploads', stdout=io.StringIO())
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, 'DONE')
+
+    def test_transient_failures_are_retried(self):
+        upload = stage_upload(self.product, 'image', image_file())
+        self.assertEqual(process_upload(upload.id, FlakyBackend(failures=1)), 'DONE')
+        upload.refresh_from_db()
+        self.assertEqual(upload.attempts, 2)
+
+    def test_replaced_image_cancels_the_older_upload(self):
+        first = stage_upload(self.product, 'image', image_file('red'))
+        second = stage_upload(self.product, 'image', image_file('blue'))
+        self.assertEqual(process_upload(first.id), 'CANCELLED')
+        self.assertEqual(process_upload(second.id), 'DONE')
+        second.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(local_path(self.product.image), local_path(second.public_id))
+
+
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.resident = make_resident('resident')
+        AccessToken.objects.create(user=self.resident, token='secret-token', scope='read write',
+                                   expires=timezone.now() + timedelta(hours=1))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer secret-token')
+
+    def token_queries(self, path='/bills/'):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        return response, [q['sql'] for q in queries.captured_queries if 'oauth2_provider_accesstoken' in q['sql']]
+
+    def test_token_lookups_are_cached_in_the_shared_cache(self):
+        response, lookups = self.token_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(lookups)
+        response, lookups = self.token_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(lookups, [])
+
+    def test_locking_the_account_rejects_the_cached_token(self):
+        self.token_queries()
+        self.resident.is_active = False
+        self.resident.save()
+        self.assertEqual(self.client.get('/bills/').status_code, 401)
+
+    def test_revoked_token_is_rejected_by_workers_that_cached_it(self):
+        self.token_queries()
+        key = authentication._key('oauth2', 'secret-token')
+        entry = authentication._local.get(key)
+        AccessToken.objects.filter(token='secret-token').delete()
+        # The revocation ran on another worker: this one's local LRU still holds the token.
+        authentication._local.set(key, entry, entry['expires_at'], entry['user_id'])
+        self.assertEqual(self.client.get('/bills/').status_code, 401)
+
+    def test_inactive_user_is_rejected(self):
+        Resident.objects.filter(pk=self.resident.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/bills/').status_code, 401)
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_no_caching_without_a_shared_cache(self):
+        for _ in range(2):
+            response, lookups = self.token_queries()
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(lookups)
+
+
+class AccountLockTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        locks._state = locks.LockState()
+        self.resident = make_resident('resident')
+        self.client.force_login(self.resident)
+
+    def test_lock_made_by_another_worker_is_seen_after_the_version_bump(self):
+        self.assertFalse(locks.is_locked(self.resident.pk))
+        # Another worker: the row changes without signals here, only the shared version moves.
+        Resident.objects.filter(pk=self.resident.pk).update(is_active=False)
+        self.assertFalse(locks.is_locked(self.resident.pk))
+        locks.bump_lock_version()
+        self.assertTrue(locks.is_locked(self.resident.pk))
+
+    def test_locking_ends_sessions_and_tokens(self):
+        AccessToken.objects.create(user=self.resident, token='secret-token', scope='read',
+                                   expires=timezone.now() + timedelta(hours=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            locks.lock_resident(self.resident)
+        self.assertTrue(locks.is_locked(self.resident.pk))
+        self.assertFalse(AccessToken.objects.filter(user=self.resident).exists())
+        self.assertFalse(UserSession.objects.filter(user=self.resident).exists())
+        response = self.client.get('/bills/')
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn('error', response.json())
+
+    def test_locking_on_a_worker_with_a_stale_lock_set(self):
+        self.assertFalse(locks.is_locked(self.resident.pk))
+        AccessToken.objects.create(user=self.resident, token='stale-token', scope='read',
+                                   expires=timezone.now() + timedelta(hours=1))
+        # Another worker changed the lock set, so this worker's version is behind when the save reloads it.
+        locks.bump_lock_version()
+        resident = Resident.objects.get(pk=self.resident.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            locks.lock_resident(resident)
+        self.assertFalse(AccessToken.objects.filter(user=self.resident).exists())
+        self.assertTrue(locks.is_locked(self.resident.pk))
+
+    def test_saving_without_changing_is_active_does_not_bump_the_version(self):
+        version = locks.lock_version()
+        resident = Resident.objects.get(pk=self.resident.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            resident.first_name = 'Lan'
+            resident.save()
+        self.assertEqual(locks.lock_version(), version)
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_without_a_shared_cache_the_database_is_checked(self):
+        self.assertEqual(self.client.get('/bills/').status_code, 200)
+        Resident.objects.filter(pk=self.resident.pk).update(is_active=False)
+        response = self.client.get('/bills/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'error': 'Account is locked'})
+
+
+class ResidentImportTests(TestCase):
+    def setUp(self):
+        self.admin = make_resident('admin', is_superuser=True, is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def rows(self, count, start=0):
+        return [{'username': f'import{n}', 'password': 'secret', 'phone': '0911111111',
+                 'family_members': [{'name': 'Child', 'numberXe': '59A-1234'}]} for n in range(start, start + count)]
+
+    def test_small_import_over_http(self):
+        response = self.client.post('/residents/import/', {'residents': self.rows(3)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 3)
+        resident = Resident.objects.get(username='import1')
+        self.assertTrue(resident.check_password('secret'))
+        self.assertEqual(resident.famember_set.count(), 1)
+
+    def test_large_imports_are_sent_to_the_command(self):
+        response = self.client.post('/residents/import/', {'residents': self.rows(51)}, format='json')
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('import_residents', response.data['error'])
+        self.assertFalse(Resident.objects.filter(username__startswith='import').exists())
+
+    def test_command_imports_a_csv(self):
+        path = os.path.join(tempfile.mkdtemp(), 'residents.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('username,password,first_name,family_members\n')
+            f.writelines(f'bulk{n},secret,Resident {n},Child:59A-{n}\n' for n in range(60))
+            f.write('bulk1,secret,Duplicate,\n')
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_residents', path, processes=1, stdout=stdout, stderr=stderr)
+        self.assertIn('60 residents created, 1 rejected', stdout.getvalue())
+        self.assertEqual(FaMember.objects.filter(resident__username__startswith='bulk').count(), 60)
+
+    def test_hashing_reuses_one_pool(self):
+        with mock.patch.object(passwords, '_new_pool') as new_pool, mock.patch.object(passwords, '_pool', None), \
+                mock.patch.object(passwords, 'PASSWORD_HASH_PROCESSES', 4):
+            new_pool.return_value.map.side_effect = lambda fn, items, chunksize: map(fn, items)
+            for _ in range(2):
+                hashed = passwords.hash_passwords(['secret'] * 40)
+        new_pool.assert_called_once_with(4)
+        self.assertEqual(len(hashed), 40)
+
+
+@mock.patch.object(replicas, 'REPLICA_DATABASES', ['replica1'])
+class ReplicaTests(TransactionTestCase):
+    # Transactional, so rows written through the primary are committed and visible to the replica connection.
+    databases = {'default', 'replica1'}
+
+    def setUp(self):
+        cache.clear()
+        self.admin = make_resident('admin', is_superuser=True)
+        self.feedback = Feedback.objects.create(resident=self.admin, content='Lift broken')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        health = mock.patch.object(replicas, 'health', replicas.ReplicaHealth())
+        health.start()
+        self.addCleanup(health.stop)
+
+    def read(self, replica_error=None):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica1']) as replica, \
+                mock.patch.object(connections['replica1'], 'ensure_connection', side_effect=replica_error):
+            response = self.client.get('/feedback/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        return len(primary), len(replica)
+
+    def write(self):
+        response = self.client.patch(f'/feedback/{self.feedback.pk}/mark_as_resolved/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_reads_go_to_the_replica(self):
+        primary, replica = self.read()
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_writes_pin_reads_to_the_primary(self):
+        self.write()
+        primary, replica = self.read()
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+        cache.clear()
+        self.assertEqual(self.read()[0], 0)
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_pin_is_kept_in_the_session_without_a_shared_cache(self):
+        self.write()
+        self.assertIsNone(replicas.cache.get(replicas._pin_key(self.admin.pk)))
+        self.assertIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+        primary, replica = self.read()
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+        with mock.patch.object(replicas.time, 'time', return_value=time.time() + replicas.REPLICA_STICKY_SECONDS + 1):
+            self.assertEqual(self.read()[0], 0)
+
+    def test_unreachable_replica_falls_back_to_the_primary(self):
+        primary, replica = self.read(replica_error=OperationalError('replica down'))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        self.assertFalse(replicas.health.available('replica1'))
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakeWrapper(PooledConnectionMixin):
+    alias = 'fake'
+    errors_occurred = False
+
+    def __init__(self, raw, in_atomic_block=False):
+        self.connection = raw
+        self.in_atomic_block = in_atomic_block
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def pool(self, **options):
+        return ConnectionPool(**{'max_size': 1, 'max_overflow': 0, 'timeout': 0.05, 'recycle': 3600, **options})
+
+    def test_checkout_times_out_when_exhausted(self):
+        pool = self.pool()
+        pool.acquire(FakeConnection)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(FakeConnection)
+        self.assertEqual(pool.snapshot()['timeouts'], 1)
+        self.assertEqual(pool.snapshot()['in_use'], 1)
+
+    def test_idle_connections_are_reused(self):
+        pool = self.pool()
+        raw = pool.acquire(FakeConnection)
+        pool.release(raw)
+        self.assertIs(pool.acquire(FakeConnection), raw)
+        self.assertEqual(pool.snapshot()['opens'], 1)
+
+    def test_overflow_connections_are_closed_on_release(self):
+        pool = self.pool(max_overflow=1)
+        first, overflow = pool.acquire(FakeConnection), pool.acquire(FakeConnection)
+        pool.release(overflow)
+        pool.release(first)
+        self.assertTrue(overflow.closed)
+        self.assertFalse(first.closed)
+        self.assertEqual(pool.snapshot()['size'], 1)
+        self.assertEqual(pool.snapshot()['idle'], 1)
+
+    def test_expired_connections_are_recycled(self):
+        pool = self.pool(recycle=60)
+        raw = pool.acquire(FakeConnection)
+        with mock.patch('apart.dbpool.pool.time.monotonic', return_value=time.monotonic() + 61):
+            pool.release(raw)
+        self.assertTrue(raw.closed)
+        self.assertIsNot(pool.acquire(FakeConnection), raw)
+        self.assertEqual(pool.snapshot()['opens'], 2)
+
+    def test_pool_keeps_tracked_connections_alive(self):
+        pool = self.pool()
+        raw = pool.acquire(FakeConnection)
+        raw_id = id(raw)
+        del raw
+        # Still referenced by the pool, so a new object cannot reuse the id and inherit its open time.
+        self.assertIsInstance(pool._opened[raw_id][0], FakeConnection)
+
+    def test_connection_closed_inside_atomic_is_discarded(self):
+        pool = self.pool()
+        with mock.patch.dict('apart.dbpool.pool._pools', {'fake': pool}):
+            raw = pool.acquire(FakeConnection)
+            FakeWrapper(raw, in_atomic_block=True)._close()
+            self.assertTrue(raw.closed)
+            self.assertEqual(pool.snapshot()['size'], 0)
+
+            raw = pool.acquire(FakeConnection)
+            FakeWrapper(raw)._close()
+            self.assertFalse(raw.closed)
+            self.assertEqual(raw.rollbacks, 1)
+            self.assertEqual(pool.snapshot()['idle'], 1)
+
+
+class PaymentCallbackTests(TestCase):
+    def setUp(self):
+        self.resident = make_resident('payer')
+        self.bill = Bill.objects.create(resident=self.resident, amount=150000, issue_date=date(2024, 5, 1),
+                                        due_date=date(2024, 5, 15), bill_type='Điện')
+
+    def ipn(self, amount=150000, signature=None, **fields):
+        provider = MomoProvider()
+        payload = {
+            'partnerCode': provider.config['partner_code'], 'orderId': 'MM1', 'requestId': 'MM1', 'amount': amount,
+            'orderInfo': 'bill', 'orderType': 'momo_wallet', 'transId': 42, 'resultCode': 0, 'message': 'ok',
+            'payType': 'qr', 'responseTime': 1700000000000,
+            'extraData': base64.b64encode(json.dumps({'bill_id': self.bill.id}).encode()).decode(), **fields,
+        }
+        payload['signature'] = provider.callback_signature(payload) if signature is None else signature
+        return self.client.post('/payment/ipn/momo/', payload, content_type='application/json')
+
+    def assert_status(self, payment_status):
+        self.bill.refresh_from_db()
+        self.assertEqual(self.bill.payment_status, payment_status)
+
+    def test_signed_ipn_marks_the_bill_paid(self):
+        self.assertEqual(self.ipn().status_code, 204)
+        self.assert_status('PAID')
+        self.assertEqual(get_bill_rollup(self.resident).paid_count, 1)
+
+    def test_replayed_ipn_is_a_no_op(self):
+        self.ipn()
+        with mock.patch.object(Bill, 'save') as save:
+            self.assertEqual(self.ipn().status_code, 204)
+        save.assert_not_called()
+        self.assert_status('PAID')
+        self.assertEqual(get_bill_rollup(self.resident).paid_count, 1)
+
+    def test_amount_mismatch_is_rejected(self):
+        response = self.ipn(amount=1000)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('does not match', response.json()['message'])
+        self.assert_status('UNPAID')
+
+    def test_forged_or_missing_signature_is_rejected(self):
+        for signature in ('forged', ''):
+            response = self.ipn(signature=signature)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'message': 'Invalid signature'})
+        self.assert_status('UNPAID')
+
+    def test_paying_a_paid_bill_is_refused(self):
+        Bill.objects.filter(pk=self.bill.pk).update(payment_status='PAID')
+        self.client.force_login(self.resident)
+        with mock.patch.object(GatewayClient, 'send') as send, mock.patch.object(AsyncGatewayClient, 'send') as asend:
+            response = self.client.post(f'/payment/bills/{self.bill.id}/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Bill is already paid'})
+        send.assert_not_called()
+        asend.assert_not_called()
@@ -0,0 +1,283 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from cloudinary import uploader
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .images import THUMBNAIL_SIZES, prepare_image
+from .media import LOCAL_PREFIX, PENDING_DIR, as_resource, local_path, thumbnail_transformation
+from .models import MediaAsset, PendingUpload
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_BACKEND = getattr(settings, 'UPLOAD_BACKEND', 'cloudinary')
+UPLOAD_WORKERS = getattr(settings, 'UPLOAD_WORKERS', 4)
+UPLOAD_MAX_ATTEMPTS = getattr(settings, 'UPLOAD_MAX_ATTEMPTS', 5)
+UPLOAD_RETRY_BACKOFF = getattr(settings, 'UPLOAD_RETRY_BACKOFF', 1)
+UPLOAD_IN_BACKGROUND = getattr(settings, 'UPLOAD_IN_BACKGROUND', True)
+
+STORE_DIR = 'uploads/store'
+
+
+def _extension(name, default='jpg'):
+    return os.path.splitext(name or '')[1].lower().lstrip('.') or default
+
+
+def _media_path(relative):
+    return os.path.join(settings.MEDIA_ROOT, relative)
+
+
+class CloudinaryBackend:
+    def store(self, path, field, derivatives=None):
+        options = {'type': field.type, 'resource_type': field.resource_type}
+        options.update({key: value for key, value in field.options.items() if not callable(value)})
+        if derivatives:
+            # Cloudinary renders its own thumbnails; build them now instead of on the first list request.
+            options['eager'] = [thumbnail_transformation(size) for size in THUMBNAIL_SIZES]
+            options['eager_async'] = True
+        return uploader.upload_resource(path, **options).get_prep_value()
+
+    def delete(self, resource):
+        uploader.destroy(resource.public_id, type=resource.type, resource_type=resource.resource_type)
+
+
+class FileSystemBackend:
+    # Offline stand-in for Cloudinary: "uploads" are copies under MEDIA_ROOT served by media_url().
+    def store(self, path, field, derivatives=None):
+        name = f'{STORE_DIR}/{uuid.uuid4().hex}'
+        os.makedirs(os.path.dirname(_media_path(name)), exist_ok=True)
+        shutil.copyfile(path, _media_path(f'{name}.{_extension(path)}'))
+        for size, derivative in (derivatives or {}).items():
+            shutil.copyfile(derivative, _media_path(f'{name}_{size}.jpg'))
+        return f'{LOCAL_PREFIX}{name}.{_extension(path)}'
+
+    def delete(self, resource):
+        path = local_path(resource)
+        if not path:
+            return
+        stem = os.path.splitext(path)[0]
+        for name in [path] + [f'{stem}_{size}.jpg' for size in THUMBNAIL_SIZES]:
+            if os.path.exists(_media_path(name)):
+                os.remove(_media_path(name))
+
+
+BACKENDS = {
+    'cloudinary': CloudinaryBackend,
+    'filesystem': FileSystemBackend,
+}
+
+
+def get_backend(name=None):
+    return BACKENDS[name or UPLOAD_BACKEND]()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='upload')
+        return _executor
+
+
+def _submit(upload_id):
+    if UPLOAD_IN_BACKGROUND:
+        _get_executor().submit(_run_in_worker, upload_id)
+    else:
+        process_upload(upload_id)
+
+
+def _run_in_worker(upload_id):
+    try:
+        process_upload(upload_id)
+    except Exception:
+        logger.exception('Upload %s crashed', upload_id)
+    finally:
+        # Worker threads are not request-scoped, so nothing else closes their connections.
+        connections.close_all()
+
+
+def spool_file(file):
+    relative = f'{PENDING_DIR}/{uuid.uuid4().hex}.{_extension(file.name)}'
+    path = _media_path(relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if hasattr(file, 'seekable') and file.seekable():
+        file.seek(0)
+    with open(path, 'wb') as out:
+        for chunk in file.chunks():
+            out.write(chunk)
+    return LOCAL_PREFIX + relative
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    if hasattr(file, 'seekable') and file.seekable():
+        file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def asset_key(value):
+    resource = as_resource(value)
+    return resource.public_id if resource is not None else None
+
+
+def _retain(asset_id):
+    return MediaAsset.objects.filter(id=asset_id).update(ref_count=F('ref_count') + 1)
+
+
+def _discard_if_unreferenced(asset_id, backend=None):
+    asset = MediaAsset.objects.select_for_update().filter(id=asset_id).first()
+    if asset is None or asset.ref_count > 0:
+        return False
+    asset.delete()
+    value = asset.value
+    transaction.on_commit(lambda: (backend or get_backend()).delete(as_resource(value)))
+    return True
+
+
+def release_media(value):
+    key = asset_key(value)
+    if not key:
+        return
+    # Images stored before the registry existed have no MediaAsset row and are never deleted here.
+    with transaction.atomic():
+        if MediaAsset.objects.filter(public_id=key, ref_count__gt=0).update(ref_count=F('ref_count') - 1):
+            _discard_if_unreferenced(MediaAsset.objects.get(public_id=key).id)
+
+
+def _assign(instance, field_name, value):
+    old_value = instance._meta.get_field(field_name).value_from_object(instance)
+    setattr(instance, field_name, value)
+    instance.save(update_fields=[field_name])
+    return old_value
+
+
+def stage_upload(instance, field_name, file):
+    digest = content_hash(file)
+    with transaction.atomic():
+        asset = MediaAsset.objects.select_for_update().filter(sha256=digest).first()
+        if asset is not None:
+            # Same bytes already stored: point at the existing asset and skip the upload entirely.
+            _retain(asset.id)
+            release_media(_assign(instance, field_name, asset.value))
+            return None
+
+    local_id = spool_file(file)
+    with transaction.atomic():
+        release_media(_assign(instance, field_name, local_id))
+        upload = PendingUpload.objects.create(content_type=ContentType.objects.get_for_model(instance),
+                                              object_id=instance.pk, field_name=field_name, local_id=local_id,
+                                              sha256=digest)
+        transaction.on_commit(lambda: _submit(upload.id))
+    return upload
+
+
+def _claim(upload_id):
+    claimed = PendingUpload.objects.filter(id=upload_id, status__in=['PENDING', 'FAILED']).update(
+        status='UPLOADING', updated_at=timezone.now())
+    return PendingUpload.objects.select_related('content_type').get(id=upload_id) if claimed else None
+
+
+def _store_with_retries(upload, backend, field, path, derivatives):
+    attempt = 0
+    while True:
+        attempt += 1
+        PendingUpload.objects.filter(id=upload.id).update(attempts=F('attempts') + 1, updated_at=timezone.now())
+        try:
+            return backend.store(path, field, derivatives)
+        except Exception as e:
+            if attempt >= UPLOAD_MAX_ATTEMPTS:
+                raise
+            pause = UPLOAD_RETRY_BACKOFF * 2 ** (attempt - 1)
+            logger.info('Upload %s attempt %d failed (%s), retrying in %ss', upload.id, attempt, e, pause)
+            time.sleep(pause)
+
+
+def _register_asset(upload, public_id, backend):
+    if not upload.sha256:
+        return None
+    with transaction.atomic():
+        asset, created = MediaAsset.objects.get_or_create(
+            sha256=upload.sha256, defaults={'public_id': asset_key(public_id), 'value': public_id})
+    if not created:
+        # An identical file finished uploading first; keep that copy and drop ours.
+        backend.delete(as_resource(public_id))
+    return asset
+
+
+def _swap(upload, field, value, asset, backend):
+    model = upload.content_type.model_class()
+    with transaction.atomic():
+        instance = model.objects.select_for_update().filter(pk=upload.object_id).first()
+        current = field.get_prep_value(getattr(instance, field.attname, None))
+        if instance is None or current != field.get_prep_value(field.to_python(upload.local_id)):
+            if asset is not None:
+                _discard_if_unreferenced(asset.id, backend)
+            return False
+        if asset is not None:
+            _retain(asset.id)
+        setattr(instance, field.attname, value)
+        # save() so the model's post_save hooks (catalog, dashboard) see the new image.
+        instance.save(update_fields=[field.name])
+    return True
+
+
+def process_upload(upload_id, backend=None):
+    upload = _claim(upload_id)
+    if upload is None:
+        return None
+    backend = backend or get_backend()
+    field = upload.content_type.model_class()._meta.get_field(upload.field_name)
+    path = _media_path(local_path(upload.local_id))
+    if not os.path.exists(path):
+        PendingUpload.objects.filter(id=upload.id).update(status='FAILED', error='Spooled file is missing')
+        return 'FAILED'
+
+    original, derivatives = path, {}
+    try:
+        path, derivatives = prepare_image(original)
+    except Exception as e:
+        # Still upload the original; thumbnail_url() falls back to it when derivatives are missing.
+        logger.warning('Upload %s: could not preprocess %s: %s', upload.id, path, e)
+
+    try:
+        public_id = _store_with_retries(upload, backend, field, path, derivatives)
+    except Exception as e:
+        logger.warning('Upload %s failed after %d attempts: %s', upload.id, UPLOAD_MAX_ATTEMPTS, e)
+        PendingUpload.objects.filter(id=upload.id).update(status='FAILED', error=str(e)[:2000])
+        return 'FAILED'
+
+    asset = _register_asset(upload, public_id, backend)
+    value = asset.value if asset is not None else public_id
+    if _swap(upload, field, value, asset, backend):
+        status = 'DONE'
+    else:
+        # The row was deleted or got a newer image while this one was uploading.
+        status = 'CANCELLED'
+        if asset is None:
+            backend.delete(as_resource(value))
+    PendingUpload.objects.filter(id=upload.id).update(status=status, public_id=value, error='')
+    for spooled in {original, path, *derivatives.values()}:
+        os.remove(spooled)
+    return status
+
+
+def requeue_stale_uploads(older_than=timedelta(minutes=10)):
+    return PendingUpload.objects.filter(status='UPLOADING', updated_at__lt=timezone.now() - older_than).update(
+        status='PENDING')
@@ -19,12 +19,15 @@ router.register('feedback', views.FeedbackViewSet, basename='feedback')
 router.register('survey', views.SurveyViewSet, basename='survey')
 router.register('surveyresult', views.SurveyResultViewSet, basename='surveyresult')
 router.register('statistics', StatisticalViewSet, basename='statistic')
+router.register('dashboard', views.DashboardViewSet, basename='dashboard')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('admin/', admin_site.urls),
     path('api/', include(router.urls)),
     path('payment/', views.payment_view, name='payment'),
+    path('payment/bills/<int:bill_id>/', views.bill_payment_view, name='bill-payment'),
+    path('payment/ipn/<str:provider>/', views.payment_ipn_view, name='payment-ipn'),
     path('api/statistics/<int:pk>/', StatisticalViewSet.as_view({'get': 'retrieve'}), name='statistics-api'),
 ]
 
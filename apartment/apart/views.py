@@ -1,36 +1,65 @@
-import hashlib
-import hmac
-from datetime import time
-import requests
-from django.db.models import Max
+import csv
+import json
+import logging
+import os
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404
-from django.http import Http404, JsonResponse, HttpRequest
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.http import Http404, JsonResponse, HttpRequest, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework import viewsets, permissions, status
-from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
 from . import paginators
+from .catalog import catalog_page_key, render_catalog_page
+from .analytics import maximum_ratings, survey_statistics
+from .carts import add_to_cart, cart_totals, prefetch_cart_lines, set_cart_quantity
+from .checkout import checkout_cart, CartChanged, EmptyCart, OutOfStock
+from .dashboard import get_dashboard
+from .locks import lock_resident
+from .onboarding import RESIDENT_IMPORT_LIMIT, import_residents, parse_residents
+from .parcels import PARCEL_BULK_LIMIT, bulk_create_parcels, bulk_mark_received
+from .gateways import GatewayError, GatewayResponseError, GatewayUnavailable, InvalidCallback, get_provider, \
+    get_request_gateway
+from .payments import BillNotPayable, PaymentMismatch, create_bill_payment, handle_callback
+from .exports import BILL_COLUMNS, ORDER_COLUMNS, SURVEY_RESULT_COLUMNS, export_queryset
+from .replicas import use_replica
+from .rollups import get_bill_rollup
+from .media import media_status, media_url
+from .uploads import stage_upload
 from .models import Flat, Item, Resident, Feedback, Survey, SurveyResult, Bill, FaMember, Cart, Product, CartProduct, \
-    Order, OrderProduct
+    Order
 from .serializers import ResidentSerializer, FlatSerializer, ItemSerializer, FeedbackSerializer, SurveySerializer, \
     SurveyResultSerializer, BillSerializer, FaMemberSerializer, CartSerializer, ProductSerializer, \
-    CartProductSerializer, OrderSerializer
+    CartProductSerializer, OrderSerializer, BulkMarkReceivedSerializer
+
+logger = logging.getLogger(__name__)
 
 
 class ResidentViewSet(viewsets.ModelViewSet):
     queryset = Resident.objects.all()
     serializer_class = ResidentSerializer
+    pagination_class = paginators.Paginator
 
     def get_permissions(self):
         if self.action in ['get_current_user', 'lock_account', 'check_account_status', 'change_password','delete_resident']:
             return [permissions.IsAuthenticated()]
-        elif self.action == 'create_new_account':
+        elif self.action in ['create_new_account', 'import_residents']:
             return [permissions.IsAuthenticated(), permissions.IsAdminUser()]
         return [permissions.AllowAny()]
 
     @action(detail=False, methods=['get'], url_path='resident-statistics')
+    @use_replica
     def resident_statistics(self, request):
         staff_count = Resident.objects.filter(is_superuser=False).count()  # Assuming is_staff indicates staff
         admin_count = Resident.objects.filter(is_superuser=True).count()  # Assuming is_superuser indicates admin
@@ -40,15 +69,20 @@ class ResidentViewSet(viewsets.ModelViewSet):
             'admin_count': admin_count,
         })
 
+    @use_replica
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def get_queryset(self):
         user = self.request.user
         if user.is_superuser:
-            return Resident.objects.all()
+            return Resident.objects.order_by('-id')
         elif user.is_staff:
             return Resident.objects.filter(id=user.id)
         return Resident.objects.none()
 
     @action(detail=False, methods=['get'], url_path='staff-count', permission_classes=[permissions.IsAuthenticated])
+    @use_replica
     def staff_count(self, request):
         staff_count = Resident.objects.filter(is_staff=True).count()  # Assuming is_staff indicates staff
         return Response({'staff_count': staff_count})
@@ -65,8 +99,7 @@ class ResidentViewSet(viewsets.ModelViewSet):
     @action(methods=['post'], detail=True, url_path='lock-account')
     def lock_account(self, request, pk=None):
         user = self.get_object()
-        user.is_active = False
-        user.save()
+        lock_resident(user)
         return Response({'status': 'account locked'}, status=status.HTTP_200_OK)
 
     @action(methods=['get'], detail=True, url_path='check-account-status')
@@ -85,6 +118,35 @@ class ResidentViewSet(viewsets.ModelViewSet):
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
+    @action(methods=['post'], detail=False, url_path='import', parser_classes=[JSONParser, MultiPartParser, FormParser])
+    def import_residents(self, request):
+        if not request.user.is_superuser:
+            return Response({'error': 'Bạn không có quyền thực hiện hành động này.'}, status=status.HTTP_403_FORBIDDEN)
+
+        upload = request.FILES.get('file')
+        try:
+            if upload is not None:
+                format = request.data.get('format') or os.path.splitext(upload.name)[1].lstrip('.').lower()
+                rows = parse_residents(upload.read(), format)
+            else:
+                rows = request.data.get('residents') if isinstance(request.data, dict) else request.data
+        except (ValueError, UnicodeError, csv.Error) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(rows, list) or not rows:
+            return Response({'error': 'residents must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > RESIDENT_IMPORT_LIMIT:
+            # Hashing runs inside the request; larger files go through `manage.py import_residents` instead.
+            return Response({'error': f'At most {RESIDENT_IMPORT_LIMIT} residents per request, '
+                                      f'use the import_residents command for larger imports'},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        try:
+            result = import_residents(rows)
+        except IntegrityError:
+            return Response({'error': 'Some usernames were created while the import was running, retry it.'},
+                            status=status.HTTP_409_CONFLICT)
+        return Response(result, status=status.HTTP_201_CREATED if result['created'] else status.HTTP_400_BAD_REQUEST)
+
     @action(methods=['post'], detail=False, url_path='change-password')
     def change_password(self, request):
         user = request.user
@@ -105,11 +167,10 @@ class ResidentViewSet(viewsets.ModelViewSet):
         if 'avatar' not in request.data:
             return Response({"error": "Avatar is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        avatar = request.data['avatar']
-        user.avatar = avatar
-        user.save()
+        stage_upload(user, 'avatar', request.data['avatar'])
 
-        return Response({"message": "Avatar updated successfully"}, status=status.HTTP_200_OK)
+        return Response({"message": "Avatar updated successfully", "avatar_url": media_url(user.avatar, request),
+                         "avatar_status": media_status(user.avatar)}, status=status.HTTP_202_ACCEPTED)
     def partial_update(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=True)
@@ -127,42 +188,51 @@ class ResidentViewSet(viewsets.ModelViewSet):
             return Response({"error": "Resident not found."}, status=status.HTTP_404_NOT_FOUND)
 
 class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+    queryset = Product.objects.order_by('-id')
     serializer_class = ProductSerializer
     pagination_class = paginators.Paginator
 
+    def list(self, request, *args, **kwargs):
+        key = catalog_page_key(request)
+        page = cache.get(key)
+        if page is None:
+            response = super().list(request, *args, **kwargs)
+            page = render_catalog_page(key, response.data)
+
+        etag, content = page
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
 class CartViewSet(viewsets.ModelViewSet):
     serializer_class = CartSerializer
     pagination_class = paginators.Paginator
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Cart.objects.filter(resident=self.request.user)
+        return Cart.objects.filter(resident=self.request.user).order_by('-id')
 
     @action(methods=['post'], detail=False, url_path='add-product')
     def add_product(self, request):
         user = request.user
         product_id = request.data.get('product_id')
         quantity = int(request.data.get('quantity', 1))
+        if quantity <= 0:
+            return Response({'error': 'Quantity must be positive'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            product = get_object_or_404(Product, id=product_id)
-        except Product.DoesNotExist:
-            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
-
+        product = get_object_or_404(Product, id=product_id)
         cart, created = Cart.objects.get_or_create(resident=user)
-        cart_product, cart_product_created = CartProduct.objects.get_or_create(cart=cart, product=product)
-
-        if not cart_product_created:
-            cart_product.quantity += quantity
-        else:
-            cart_product.quantity = quantity
-
-        cart_product.save()
-        cart.refresh_from_db()
-        serialized_cart = CartSerializer(cart)
+        cart_product = add_to_cart(cart, product, quantity)
 
-        return Response({'status': 'Product added to cart', 'cart': serialized_cart.data}, status=status.HTTP_200_OK)
+        return Response({
+            'status': 'Product added to cart',
+            'item': CartProductSerializer(cart_product).data,
+            'total_price': cart_totals(cart.id)['total_price']
+        }, status=status.HTTP_200_OK)
 
     @action(methods=['get'], detail=False, url_path='cart-summary')
     def cart_summary(self, request):
@@ -172,12 +242,12 @@ class CartViewSet(viewsets.ModelViewSet):
         except Cart.DoesNotExist:
             return Response({'error': 'Cart not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        cart_products = CartProduct.objects.filter(cart=cart)
+        cart_products = CartProduct.objects.filter(cart=cart).select_related('product')
         serialized_cart_products = CartProductSerializer(cart_products, many=True)
+        totals = cart_totals(cart.id)
 
-        total_price = sum(item.product.price * item.quantity for item in cart_products)
-
-        return Response({'cart_products': serialized_cart_products.data, 'total_price': total_price}, status=status.HTTP_200_OK)
+        return Response({'cart_products': serialized_cart_products.data, 'total_price': totals['total_price'],
+                         'line_count': totals['line_count']}, status=status.HTTP_200_OK)
 
     @action(methods=['delete'], detail=True, url_path='delete-product')
     def delete_product(self, request, pk=None):
@@ -196,64 +266,48 @@ class CartViewSet(viewsets.ModelViewSet):
         product_id = request.data.get('product_id')
         quantity = int(request.data.get('quantity', 1))
 
-        try:
-            product = get_object_or_404(Product, id=product_id)
-        except Product.DoesNotExist:
-            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
-
         try:
             cart = Cart.objects.get(resident=user)
-            cart_product = CartProduct.objects.get(cart=cart, product=product)
-        except (Cart.DoesNotExist, CartProduct.DoesNotExist):
+        except Cart.DoesNotExist:
             return Response({'error': 'Cart or CartProduct not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        if quantity <= 0:
-            cart_product.delete()
-        else:
-            cart_product.quantity = quantity
-            cart_product.save()
-
-        total_price = sum(item.product.price * item.quantity for item in CartProduct.objects.filter(cart=cart))
+        if not set_cart_quantity(cart, product_id, quantity):
+            return Response({'error': 'Cart or CartProduct not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        serialized_cart = CartSerializer(cart)
+        serialized_cart = CartSerializer(prefetch_cart_lines(cart))
 
         return Response({
             'status': 'Product quantity updated',
             'cart': serialized_cart.data,
-            'total_price': total_price
+            'total_price': cart_totals(cart.id)['total_price']
         }, status=status.HTTP_200_OK)
 
 class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+    queryset = Order.objects.select_related('resident').prefetch_related('order_products__product').order_by('-id')
     serializer_class = OrderSerializer
+    pagination_class = paginators.Paginator
     permission_classes = [IsAuthenticated]
 
     @action(detail=False, methods=['post'], url_path='create-order-from-cart')
     def create_order_from_cart(self, request):
-        user = request.user
         try:
-            cart = Cart.objects.get(resident=user)
-        except Cart.DoesNotExist:
-            return Response({'error': 'Cart not found'}, status=status.HTTP_404_NOT_FOUND)
-
-        order = Order.objects.create(resident=user, total_amount=0)
-        cart_products = CartProduct.objects.filter(cart=cart)
-        total_amount = 0
-
-        for item in cart_products:
-            OrderProduct.objects.create(order=order, product=item.product, quantity=item.quantity,
-                                        price=item.product.price)
-            total_amount += item.product.price * item.quantity
-
-        order.total_amount = total_amount
-        order.save()
+            order = checkout_cart(request.user)
+        except EmptyCart as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except OutOfStock as e:
+            return Response({'error': str(e), 'shortages': e.shortages}, status=status.HTTP_409_CONFLICT)
+        except CartChanged as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+
+        order = Order.objects.select_related('resident').prefetch_related('order_products__product').get(pk=order.pk)
         serialized_order = OrderSerializer(order)
-
-        # Clear the cart after creating the order
-        cart_products.delete()
-
         return Response(serialized_order.data, status=status.HTTP_201_CREATED)
 
+    @action(methods=['get'], detail=False, url_path='export')
+    def export(self, request, *args, **kwargs):
+        queryset = Order.objects.all() if request.user.is_superuser else Order.objects.filter(resident=request.user)
+        return export_queryset(request, queryset, ORDER_COLUMNS, 'orders')
+
     @action(detail=True, methods=['post'], url_path='confirm-order')
     def confirm_order(self, request, pk=None):
         user = request.user
@@ -270,32 +324,32 @@ class OrderViewSet(viewsets.ModelViewSet):
 
 class BillViewSet(viewsets.ModelViewSet):
     serializer_class = BillSerializer
-    #pagination_class = paginators.Paginator
+    pagination_class = paginators.Paginator
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         resident = self.request.user
         if resident.is_superuser:
-            queryset = Bill.objects.all()
+            queryset = Bill.objects.select_related('resident').order_by('-id')
         else:
-            queryset = Bill.objects.filter(resident=resident)
+            queryset = Bill.objects.filter(resident=resident).select_related('resident').order_by('-id')
 
         payment_status = self.request.query_params.get('payment_status', None)
         if payment_status:
             queryset = queryset.filter(payment_status=payment_status.upper())
         return queryset
 
+    @use_replica
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     @action(methods=['get'], detail=False, url_path='total-bills')
+    @use_replica
     def total_bills(self, request, *args, **kwargs):
         resident = self.request.user
-        if resident.is_superuser:
-            bills = Bill.objects.all()
-        else:
-            bills = Bill.objects.filter(resident=resident)
-
-        total_bills = bills.count()
+        rollup = get_bill_rollup(None if resident.is_superuser else resident)
 
-        return Response({'total_bills': total_bills}, status=status.HTTP_200_OK)
+        return Response({'total_bills': rollup.total_count}, status=status.HTTP_200_OK)
 
     @action(methods=['post'], detail=False, url_path='create-bill')
     def create_bill(self, request, *args, **kwargs):
@@ -325,26 +379,30 @@ class BillViewSet(viewsets.ModelViewSet):
             return Response({"error": "Bill not found."}, status=status.HTTP_404_NOT_FOUND)
 
     @action(methods=['get'], detail=False, url_path='bill-statistics', permission_classes=[permissions.IsAuthenticated])
+    @use_replica
     def bill_statistics(self, request, *args, **kwargs):
         resident = self.request.user
-        if resident.is_superuser:
-            bills = Bill.objects.all()
-        else:
-            bills = Bill.objects.filter(resident=resident)
-
-        paid_bills = bills.filter(payment_status='PAID').count()
-        unpaid_bills = bills.filter(payment_status='UNPAID').count()
+        rollup = get_bill_rollup(None if resident.is_superuser else resident)
 
         return Response({
-            'paid_bills': paid_bills,
-            'unpaid_bills': unpaid_bills
+            'paid_bills': rollup.paid_count,
+            'unpaid_bills': rollup.unpaid_count,
+            'paid_amount': rollup.paid_amount,
+            'unpaid_amount': rollup.unpaid_amount
         })
+
+    @action(methods=['get'], detail=False, url_path='export')
+    def export(self, request, *args, **kwargs):
+        return export_queryset(request, self.get_queryset(), BILL_COLUMNS, 'bills')
+
+
 class PaymentViewSet(viewsets.ModelViewSet):
     serializer_class = BillSerializer
+    pagination_class = paginators.Paginator
     permission_classes = [IsAuthenticated]
     def get_queryset(self):
         resident = self.request.user
-        queryset = Bill.objects. filter(resident=resident, payment_status='UNPAID')
+        queryset = Bill.objects.filter(resident=resident, payment_status='UNPAID').select_related('resident').order_by('-id')
         return queryset
 
     def partial_update(self, request, *args, **kwargs):
@@ -355,59 +413,80 @@ class PaymentViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 @csrf_exempt
-def payment_view(request: HttpRequest):
-    partnerCode = "MOMO"
-    accessKey = "F8BBA842ECF85"
-    secretKey = "K951B6PE1waDMi640xX08PD3vg6EkVlz"
-    requestId = f"{partnerCode}{int(time.time() * 1000)}"
-    orderId = 'MM' + str(int(time.time() * 1000))
-    orderInfo = "pay with MoMo"
-    redirectUrl = "https://momo.vn/return"
-    ipnUrl = "https://callback.url/notify"
+async def payment_view(request: HttpRequest):
     amount = request.headers.get('amount', '')
-    requestType = "payWithATM"
-    extraData = ""
-
-    # Construct raw signature
-    rawSignature = f"accessKey={accessKey}&amount={amount}&extraData={extraData}&ipnUrl={ipnUrl}&orderId={orderId}&orderInfo={orderInfo}&partnerCode={partnerCode}&redirectUrl={redirectUrl}&requestId={requestId}&requestType={requestType}"
-
-    # Generate signature using HMAC-SHA256
-    signature = hmac.new(secretKey.encode(), rawSignature.encode(), hashlib.sha256).hexdigest()
-
-    # Create request body as JSON
-    data = {
-        "partnerCode": partnerCode,
-        "accessKey": accessKey,
-        "requestId": requestId,
-        "amount": amount,
-        "orderId": orderId,
-        "orderInfo": orderInfo,
-        "redirectUrl": redirectUrl,
-        "ipnUrl": ipnUrl,
-        "extraData": extraData,
-        "requestType": requestType,
-        "signature": signature,
-        "lang": "vi"
-    }
-
-    # Send request to MoMo endpoint
-    url = 'https://test-payment.momo.vn/v2/gateway/api/create'
-    headers = {'Content-Type': 'application/json'}
-    response = requests.post(url, json=data, headers=headers)
-
-    # Process response
-    if response.status_code == 200:
-        response_data = response.json()
-        pay_url = response_data.get('payUrl')
-        return JsonResponse(response_data)
+    if not amount.isdigit():
+        return JsonResponse({"error": "A positive integer amount header is required."}, status=400)
+    try:
+        gateway = get_request_gateway(request, request.GET.get('provider', 'momo'))
+        payment = await gateway.acreate_payment(int(amount), gateway.provider.description)
+    except GatewayUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=503, headers={'Retry-After': str(gateway.breaker.reset_timeout)})
+    except GatewayResponseError as e:
+        return JsonResponse({"error": str(e), "details": e.payload}, status=502)
+    except GatewayError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(payment['raw'])
+
+
+def _api_user(request):
+    drf_request = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+                          authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    return drf_request.user
+
+
+@csrf_exempt
+@require_POST
+async def bill_payment_view(request: HttpRequest, bill_id):
+    try:
+        user = await sync_to_async(_api_user)(request)
+    except APIException as e:
+        return JsonResponse({"error": str(e.detail)}, status=e.status_code)
+    if not user.is_authenticated:
+        return JsonResponse({"error": "Authentication credentials were not provided."}, status=401)
+
+    try:
+        payment = await create_bill_payment(bill_id, user,
+                                            get_request_gateway(request, request.GET.get('provider', 'momo')))
+    except BillNotPayable as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except GatewayUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=503)
+    except GatewayResponseError as e:
+        return JsonResponse({"error": str(e), "details": e.payload}, status=502)
+    except GatewayError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse({'bill_id': bill_id, 'provider': payment['provider'], 'order_id': payment['order_id'],
+                         'pay_url': payment['pay_url']})
+
+
+@csrf_exempt
+@require_POST
+async def payment_ipn_view(request: HttpRequest, provider):
+    try:
+        provider = get_provider(provider)
+    except GatewayError:
+        raise Http404
+    try:
+        payload = json.loads(request.body)
+        await handle_callback(provider, payload)
+    except (ValueError, AttributeError):
+        status_code, body = provider.callback_response('Malformed callback')
+    except (InvalidCallback, PaymentMismatch) as e:
+        logger.warning('Rejected %s payment callback: %s', provider.name, e)
+        status_code, body = provider.callback_response(e)
     else:
-        return JsonResponse({"error": f"Failed to create payment request. Status code: {response.status_code}"},
-                            status=500)
+        status_code, body = provider.callback_response()
+    if body is None:
+        return HttpResponse(status=status_code)
+    return JsonResponse(body, status=status_code)
 
 class FlatViewSet(viewsets.ModelViewSet):
-    queryset = Flat.objects.all()
+    queryset = Flat.objects.order_by('-id')
     serializer_class = FlatSerializer
+    pagination_class = paginators.Paginator
     @action(detail=False, methods=['get'], url_path='flat-count', permission_classes=[permissions.IsAuthenticated])
+    @use_replica
     def flat_count(self, request):
         flat_count = Flat.objects.all().count()  # Assuming is_staff indicates staff
         return Response({'flat_count': flat_count})
@@ -421,9 +500,9 @@ class ItemViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if user.is_superuser:
-            queryset = Item.objects.all()
+            queryset = Item.objects.select_related('resident').order_by('-id')
         else:
-            queryset = Item.objects.filter(resident=user)
+            queryset = Item.objects.filter(resident=user).select_related('resident').order_by('-id')
 
         status_filter = self.request.query_params.get('status', None)
         if status_filter:
@@ -431,6 +510,10 @@ class ItemViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    @use_replica
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     @action(methods=['post'], detail=False, url_path='create-item')
     def create_item(self, request, *args, **kwargs):
         if not request.user.is_superuser:
@@ -456,6 +539,37 @@ class ItemViewSet(viewsets.ModelViewSet):
         serializer.save()
         return Response(serializer.data)
 
+    @action(methods=['post'], detail=False, url_path='bulk-create')
+    def bulk_create_items(self, request):
+        if not request.user.is_superuser:
+            return Response({"error": "Only superusers can create item"}, status=status.HTTP_403_FORBIDDEN)
+
+        rows = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            return Response({"error": "items must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > PARCEL_BULK_LIMIT:
+            return Response({"error": f"At most {PARCEL_BULK_LIMIT} items per request"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = bulk_create_parcels(rows)
+        created = sum(1 for result in results if result['status'] == 'created')
+        return Response({'created': created, 'failed': len(results) - created, 'results': results},
+                        status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
+    @action(methods=['post'], detail=False, url_path='bulk-mark-received')
+    def bulk_mark_received(self, request):
+        user = request.user
+        if not (user.is_superuser and user.is_staff):
+            return Response({"detail": "Only superusers or staff members can mark items as received."},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        serializer = BulkMarkReceivedSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        received, results = bulk_mark_received(Item.objects.all(), serializer.validated_data['ids'])
+        return Response({'received': received, 'results': results}, status=status.HTTP_200_OK)
+
 class FaMemberViewSet(viewsets.ModelViewSet):
     queryset = FaMember.objects.all()
     serializer_class = FaMemberSerializer
@@ -464,11 +578,15 @@ class FaMemberViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if user.is_superuser:
-            return FaMember.objects.all()
+            return FaMember.objects.order_by('-id')
         elif user.is_staff:
             return FaMember.objects.filter(id=user.id)
         return FaMember.objects.none()
 
+    @use_replica
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 class FeedbackViewSet(viewsets.ModelViewSet):
     queryset = Feedback.objects.all()
     serializer_class = FeedbackSerializer
@@ -478,13 +596,19 @@ class FeedbackViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         resident = self.request.user
         queryset = Feedback.objects.all() if resident.is_superuser else Feedback.objects.filter(resident=resident)
+        queryset = queryset.order_by('-id')
 
         resolved_status = self.request.query_params.get('resolved', None)
         if resolved_status is not None:
-            queryset = queryset.filter(resolved=(resolved_status.lower() == 'true'))
+            # resolved=False compiles to "NOT resolved", which no index can serve; IN keeps it an equality.
+            queryset = queryset.filter(resolved__in=[resolved_status.lower() == 'true'])
 
         return queryset
 
+    @use_replica
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def create(self, request):
         serializer = FeedbackSerializer(data=request.data)
         if serializer.is_valid():
@@ -514,9 +638,10 @@ class FeedbackViewSet(viewsets.ModelViewSet):
             raise Http404("Feedback not found.")
 
 class SurveyViewSet(viewsets.ModelViewSet):
-    queryset = Survey.objects.all()
+    queryset = Survey.objects.order_by('-id')
     serializer_class = SurveySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = paginators.Paginator
 
     def perform_create(self, serializer):
         if not self.request.user.is_superuser:
@@ -525,10 +650,11 @@ class SurveyViewSet(viewsets.ModelViewSet):
         # Lưu khảo sát với creator là người dùng hiện tại
         serializer.save(creator=self.request.user)
 
+    @use_replica
     def list(self, request):
-        queryset = self.get_queryset()
-        serializer = self.serializer_class(queryset, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.serializer_class(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(methods=['post'], detail=False, url_path='create-survey')
     def create_survey(self, request, *args, **kwargs):
@@ -543,11 +669,12 @@ class SurveyViewSet(viewsets.ModelViewSet):
 class SurveyResultViewSet(viewsets.ModelViewSet):
     queryset = SurveyResult.objects.all()
     serializer_class = SurveyResultSerializer
+    pagination_class = paginators.Paginator
 
     def get_queryset(self):
         user = self.request.user
         if user.is_superuser:
-            return SurveyResult.objects.all()
+            return SurveyResult.objects.select_related('resident').order_by('-id')
         elif user.is_staff:
             return SurveyResult.objects.filter(id=user.id)
         return SurveyResult.objects.none()
@@ -559,12 +686,14 @@ class SurveyResultViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @use_replica
     def list(self, request):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(methods=['get'], detail=False, url_path='survey-count')
+    @use_replica
     def survey_count(self, request, *args, **kwargs):
         resident = self.request.user
         if resident.is_superuser:
@@ -583,6 +712,10 @@ class SurveyResultViewSet(viewsets.ModelViewSet):
         serializer.save()
         return Response(serializer.data)
 
+    @action(methods=['get'], detail=False, url_path='export')
+    def export(self, request, *args, **kwargs):
+        return export_queryset(request, self.get_queryset(), SURVEY_RESULT_COLUMNS, 'survey-results')
+
     @action(detail=True, methods=['delete'], url_path='delete-result')
     def delete_result(self, request, pk=None):
         try:
@@ -594,29 +727,28 @@ class SurveyResultViewSet(viewsets.ModelViewSet):
 
 
 
+class DashboardViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    @use_replica
+    def list(self, request):
+        return Response(get_dashboard(request.user), status=status.HTTP_200_OK)
+
+
 class StatisticalViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     def list(self, request):
         return Response({"message": "Please provide a survey_id to get cleanliness statistics."}, status=400)
 
+    @use_replica
     def retrieve(self, request, pk=None):
         try:
-            queryset = SurveyResult.objects.filter(survey_id=pk)
-            if not queryset.exists():
+            summary = survey_statistics(int(pk))
+            if not summary['count']:
                 return Response({"message": "Survey with the specified ID does not exist."}, status=404)
 
-            stats = queryset.aggregate(
-                maximum_cleanliness=Max('cleanliness_rating'),
-                maximum_facilities=Max('facilities_rating'),
-                maximum_services=Max('services_rating')
-            )
-
-            return Response({
-                'maximum_cleanliness': stats['maximum_cleanliness'],
-                'maximum_facilities': stats['maximum_facilities'],
-                'maximum_services': stats['maximum_services']
-            })
+            return Response({**maximum_ratings(summary), **summary})
         except Exception as e:
             return Response({"message": str(e)}, status=500)
 
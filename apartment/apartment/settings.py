@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 import cloudinary.api
 
@@ -61,15 +62,18 @@ CORS_ALLOW_CREDENTIALS = True
 
 
 MIDDLEWARE = [
+    'corsheaders.middleware.CorsMiddleware',
+    'apart.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    # Inside SessionMiddleware, so a read-your-writes pin kept in the session is saved with the response.
+    'apart.replicas.ReplicaStickinessMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'apart.middleware.CheckIsActiveMiddleware',
-    'corsheaders.middleware.CorsMiddleware',
 ]
 
 ROOT_URLCONF = 'apartment.urls'
@@ -101,16 +105,84 @@ AUTH_USER_MODEL = 'apart.Resident'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Connections persist for CONN_MAX_AGE seconds and are health-checked before reuse. Under ASGI or threaded servers
+# switch ENGINE to 'apart.dbpool' with CONN_MAX_AGE 0 and e.g.
+#   'POOL': {'MAX_SIZE': 10, 'MAX_OVERFLOW': 10, 'TIMEOUT': 30, 'RECYCLE': 3600}
+# so requests borrow from a per-process pool. Counters: /admin/db-connections/.
 DATABASES = {
     'default': {
     'ENGINE': 'django.db.backends.mysql',
     'NAME': 'quanlychungcu',
     'USER': 'root',
     'PASSWORD': 'Diemhang662',
-    'HOST': ''
+    'HOST': '',
+    'CONN_MAX_AGE': 60,
+    'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas: aliases in DATABASES that views decorated with @use_replica read from. Add each one as
+#   'replica1': {..., 'TEST': {'MIRROR': 'default'}}
+# and list it here. A user's reads stay on the primary for REPLICA_STICKY_SECONDS after they POST/PUT/PATCH/DELETE
+# (pinned in the default cache when it is shared, otherwise in their session),
+# and a replica that fails to connect is skipped for REPLICA_RETRY_INTERVAL seconds.
+DATABASE_ROUTERS = ['apart.replicas.ReplicaRouter']
+REPLICA_DATABASES = []
+REPLICA_STICKY_SECONDS = 5
+REPLICA_RETRY_INTERVAL = 30
+
+
+# Must be shared by every worker: cache invalidations (carts, catalog, dashboard, survey stats, auth, account
+# locks, replica pins) are only seen by other processes through it.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    }
+}
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Authenticated token -> user snapshots (apart.authentication): per-process LRU size, TTL cap in
+# seconds (also capped at token expiry), and the cache alias shared by all workers. Authentication is only
+# cached when that alias is Redis or Memcached (or another cross-process backend); None turns it off.
+AUTH_CACHE_SIZE = 10000
+AUTH_CACHE_TIMEOUT = 300
+AUTH_CACHE_ALIAS = 'default'
+
+CART_TOTALS_TIMEOUT = 300
+CATALOG_CACHE_TIMEOUT = 600
+MEDIA_URL_CACHE_SIZE = 8192
+DASHBOARD_CACHE_TIMEOUT = 30
+SURVEY_STATS_TIMEOUT = 3600
+SURVEY_STATS_CHUNK_SIZE = 5000
+EXPORT_CHUNK_SIZE = 2000
+BILLING_CHUNK_SIZE = 2000
+PARCEL_BULK_LIMIT = 1000
+RESIDENT_IMPORT_CHUNK_SIZE = 1000
+# Rows accepted by POST residents/import/, which hashes passwords inside the request; use
+# `manage.py import_residents` for anything larger.
+RESIDENT_IMPORT_LIMIT = 50
+
+# Image uploads are spooled under MEDIA_ROOT and pushed to storage by a worker pool (apart.uploads).
+# UPLOAD_BACKEND = 'filesystem' keeps everything on local disk for offline development and tests.
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+UPLOAD_BACKEND = 'cloudinary'
+UPLOAD_WORKERS = 4
+UPLOAD_MAX_ATTEMPTS = 5
+UPLOAD_RETRY_BACKOFF = 1
+UPLOAD_IN_BACKGROUND = True
+# Ingest preprocessing (apart.images): longest side in px, JPEG quality, pool size (0 = inline).
+IMAGE_MAX_SIZE = 1600
+IMAGE_QUALITY = 82
+IMAGE_PROCESSES = 2
+THUMBNAIL_SIZES = {'list': (160, 160), 'detail': (640, 640)}
+
+# Bulk resident imports hash passwords on a pool of this many worker processes, shared by all requests of a
+# server process (None = all cores).
+PASSWORD_HASH_PROCESSES = None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -157,18 +229,51 @@ CLIENT_SECRET='vxPObcUCtPZ25ZxHzujWQew34clKvPioOxLJuBYY8VYKBqFreHYjOxV1lamby4SIM
 REST_FRAMEWORK = {
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
+        'apart.authentication.CachedOAuth2Authentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'apart.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
 }
 
+# Per-request SQL instrumentation (apart.middleware.QueryInstrumentationMiddleware).
+# Budgets are keyed by URL name; set QUERY_BUDGET_ENFORCE = True in tests to fail on overrun.
+QUERY_N_PLUS_ONE_THRESHOLD = 3
+QUERY_BUDGET_ENFORCE = False
+QUERY_BUDGETS = {
+    'bill-list': 5,
+    'order-list': 5,
+    'resident-list': 5,
+    'product-list': 5,
+    'item-list': 5,
+    'cart-cart-summary': 5,
+}
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'apart': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
 
-
-
-
-
+# Outbound payment gateway client (apart.gateways). Timeouts are in seconds; "endpoints" overrides the
+# provider URL per name, e.g. {'momo': 'http://127.0.0.1:8765/momo'} with `manage.py run_stub_gateway`.
+PAYMENT_GATEWAY = {
+    'connect_timeout': 3.05,
+    'read_timeout': 10,
+    'deadline': 15,
+    'retries': 2,
+    'pool_size': 10,
+    'async_pool_size': 100,
+    'failure_threshold': 5,
+    'reset_timeout': 30,
+    'endpoints': {},
+    # Public URL of /payment/ipn/<provider>/ that the gateway should call back.
+    'callback_urls': {},
+}
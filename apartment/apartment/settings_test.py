@@ -0,0 +1,45 @@
+import os
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+
+# python manage.py test apart.tests --settings=apartment.settings_test
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(tempfile.gettempdir(), 'apartment-test.sqlite3'),
+    },
+    # Only read from by the replica tests, which list it in apart.replicas.REPLICA_DATABASES.
+    'replica1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(tempfile.gettempdir(), 'apartment-test-replica1.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+MEDIA_ROOT = os.path.join(tempfile.gettempdir(), 'apartment-test-media')
+UPLOAD_BACKEND = 'filesystem'
+UPLOAD_IN_BACKGROUND = False
+UPLOAD_RETRY_BACKOFF = 0
+IMAGE_PROCESSES = 0
+
+QUERY_BUDGET_ENFORCE = True
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'loggers': {
+        'apart': {'level': 'ERROR'},
+        'django.request': {'level': 'CRITICAL'},
+    },
+}
+
+# File-based so the cache is shared between processes, like the Redis cache in production.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'apartment-test-cache'),
+    },
+}